@@ -2,21 +2,44 @@ from flask import Flask, render_template, request, jsonify
 import requests
 import json
 import asyncio
+import atexit
 import zipfile
 import os
 import subprocess
 import time
 import re
+import socket
 from pathlib import Path
 import base64
 import csv
 from datetime import datetime
-from playwright.sync_api import sync_playwright
 from dotenv import dotenv_values
 from browser_use.llm import ChatAnthropic
 from browser_use import Agent, BrowserSession
-from bots import OpenAILLM
+from bots import OpenAILLM, AsyncOpenAILLM, run_async
 from prompts import get_prompt
+from json_repair import parse_stage_output
+from stage_graph import StageGraph, StageError
+from browser_pool import browser_pool, CHROME_PATH
+from readiness import probe_instances
+from artifacts import wait_for_artifact, ARTIFACT_TIMEOUT
+import dep_cache
+import npm_install
+import dep_preflight
+import compile_gate
+import load_check
+from screenshot_service import screenshot_service
+import replay
+from replay import replay_store
+import compiled_tests
+from compiled_tests import compiled_test_store, COMPILE_TESTS, COMPILE_CONCURRENCY
+import smoke
+from smoke import SMOKE_CHECKS
+import test_impact
+from test_impact import impact_index
+from workspace import Workspace, WORKSPACE_ROOT
+import static_serve
+from static_serve import static_server
 
 # Load only selected keys from bolt.diy/.env.local if present
 ENV_PATH = Path(__file__).resolve().parents[1] / "bolt.diy" / ".env.local"
@@ -28,6 +51,9 @@ if ENV_PATH.exists():
             os.environ[key_name] = value
 
 PARALLEL_AGENT_COUNT = int(os.environ.get("PARALLEL_AGENT_COUNT", "3"))
+# Expand each high-level requirement with its own REQUIREMENT_LIST request
+REQUIREMENT_LIST_PARALLEL = os.environ.get("REQUIREMENT_LIST_PARALLEL", "1") != "0"
+REQUIREMENT_LIST_CONCURRENCY = int(os.environ.get("REQUIREMENT_LIST_CONCURRENCY", "5"))
 round_limit = 6
 agent_execution_status = {
     "is_running": False,
@@ -47,8 +73,11 @@ compare_result = None
 vali_run_counter = 0
 csv_file_path = None
 max_wait_time = 2 * 60 * 60
+artifact_timeout = ARTIFACT_TIMEOUT
 id = "000"
-browser_session = BrowserSession(executable_path='/Applications/Google Chrome.app/Contents/MacOS/Google Chrome')
+textgen_timings = {}
+textgen_graph = None
+browser_session = BrowserSession(executable_path=CHROME_PATH)
 llm = ChatAnthropic(
     model="claude-sonnet-4-20250514",
 )
@@ -57,9 +86,25 @@ app = Flask(__name__)
 
 DETECTION_TIMEOUT = 60
 PM2_LOG_DIR = os.path.expanduser("~/.pm2/logs")
+# Per-client app names and log files, so concurrent clients never touch each other's instances
+PM2_APP_PREFIX = os.environ.get("PM2_APP_PREFIX", f"webapp-{os.getpid()}-")
+PM2_RUN_LOG_DIR = os.path.join(PM2_LOG_DIR, PM2_APP_PREFIX.rstrip("-"))
+# Update one persistent workspace per round and keep the dev servers running between rounds
+INCREMENTAL_ROUNDS = os.environ.get("INCREMENTAL_ROUNDS", "1") != "0"
+# Re-run only the criteria affected by the round's changes (see test_impact)
+TEST_SELECTION = test_impact.TEST_SELECTION
+# Stop a round once this many tests (0 = off) or this share of all tests (0 = off) have failed
+FAIL_FAST_COUNT = int(os.environ.get("FAIL_FAST_COUNT", "0"))
+FAIL_FAST_RATIO = float(os.environ.get("FAIL_FAST_RATIO", "0"))
+round_workspace = Workspace(WORKSPACE_ROOT / PM2_APP_PREFIX.rstrip("-"))
+# valiv2 chdirs into the workspace; a new job moves back here before removing it
+LAUNCH_DIR = os.getcwd()
+live_webapps = None
 
 def _reset():
+    """Clear per-job state; called when a new job starts with /textgen or /textgenv1."""
     global agent_execution_status, image, global_test_criteria, compare_result, vali_run_counter, csv_file_path
+    global textgen_graph, textgen_timings, live_webapps
     agent_execution_status = {
         "is_running": False,
         "total_agents": PARALLEL_AGENT_COUNT,
@@ -72,19 +117,16 @@ def _reset():
     compare_result = None
     vali_run_counter = 0
     csv_file_path = None
+    textgen_graph = None
+    textgen_timings = {}
+    impact_index.reset()
+    # The next job starts from an empty workspace, not a diff against this job's manifest
+    live_webapps = None
+    if Path(os.getcwd()).resolve().is_relative_to(round_workspace.path.resolve()):
+        os.chdir(LAUNCH_DIR)
+    _shutdown_webapps()
 
 
-def _remove_files_in_dir(dir_path: str) -> None:
-    if not os.path.isdir(dir_path):
-        return
-    for entry in os.listdir(dir_path):
-        fp = os.path.join(dir_path, entry)
-        if os.path.isfile(fp):
-            try:
-                os.remove(fp)
-            except Exception:
-                pass
-
 def _run_cmd(cmd: str, cwd: str | None = None, check: bool = False, capture: bool = False, timeout: int = 300):
     kwargs = {"shell": True, "cwd": cwd, "timeout": timeout}
     if capture:
@@ -111,18 +153,61 @@ def _read_package_script_name(app_dir: str) -> str:
     return "dev"
 
 
-def _write_ecosystem_for_instances(app_dir: str, num_instances: int, script_name: str) -> str:
+def _read_package_script(app_dir: str, script_name: str) -> str:
+    try:
+        with open(Path(app_dir) / "package.json", "r", encoding="utf-8") as f:
+            return ((json.load(f).get("scripts") or {}).get(script_name)) or ""
+    except Exception:
+        return ""
+
+
+def _allocate_ports(count: int) -> list[int]:
+    """Reserve `count` distinct free ports; sockets stay bound until all are chosen so none repeats."""
+    sockets = []
+    try:
+        for _ in range(count):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            sockets.append(s)
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+def _pm2_app_names(num_instances: int) -> list[str]:
+    return [f"{PM2_APP_PREFIX}{i+1}" for i in range(num_instances)]
+
+
+def _pm2_log_files(name: str) -> list[str]:
+    return [
+        os.path.join(PM2_RUN_LOG_DIR, f"{name}-out.log"),
+        os.path.join(PM2_RUN_LOG_DIR, f"{name}-error.log"),
+    ]
+
+
+def _write_ecosystem_for_instances(app_dir: str, num_instances: int, script_name: str, ports: list[int] | None = None) -> str:
     apps = []
-    for i in range(num_instances):
-        app_name = f"webapp-{i+1}"
+    # Vite ignores $PORT, so it also gets the port on the command line
+    is_vite = "vite" in _read_package_script(app_dir, script_name)
+    for i, app_name in enumerate(_pm2_app_names(num_instances)):
         # Ensure the path is properly escaped for JSON
         safe_app_dir = app_dir.replace("\\", "/")
+        args = f"run {script_name}"
+        env = {}
+        if ports:
+            env["PORT"] = str(ports[i])
+            if is_vite:
+                args += f" -- --port {ports[i]} --strictPort"
+        out_file, error_file = _pm2_log_files(app_name)
         apps.append({
             "name": app_name,
             "cwd": safe_app_dir,
             "script": "npm",
-            "args": f"run {script_name}",
-            "env": {}
+            "args": args,
+            "env": env,
+            "out_file": out_file,
+            "error_file": error_file,
         })
     config = {"apps": apps}
     ecosystem_path = os.path.join(app_dir, "ecosystem.config.cjs")
@@ -139,64 +224,106 @@ def _pm2_start(ecosystem_file: str, app_dir: str, app_names: list[str]):
     _run_cmd(f'pm2 start "{ecosystem_file}"', cwd=app_dir, check=True)
 
 
-def _detect_ports_from_pm2_logs(app_names: list[str], timeout: int = DETECTION_TIMEOUT) -> list[int]:
+class _LogTailer:
+    """Reads only the bytes appended to a set of log files since the previous call."""
+    def __init__(self, paths: list[str]) -> None:
+        self.offsets = {path: 0 for path in paths}
+        self.carry = {path: "" for path in paths}
+
+    def read_new(self) -> str:
+        chunks = []
+        for path in self.offsets:
+            try:
+                with open(path, "rb") as f:
+                    f.seek(self.offsets[path])
+                    data = f.read()
+            except OSError:
+                continue
+            if not data:
+                continue
+            self.offsets[path] += len(data)
+            # Hold back the unfinished last line so a URL split across writes is still matched
+            text = self.carry[path] + data.decode("utf-8", errors="ignore")
+            head, _, tail = text.rpartition("\n")
+            self.carry[path] = tail[-4096:]
+            chunks.append(head)
+        return "\n".join(chunks)
+
+
+def _port_open(port: int) -> bool:
+    # Vite on Node >= 17 resolves localhost to ::1 and may listen there only
+    for family, host in ((socket.AF_INET, "127.0.0.1"), (socket.AF_INET6, "::1")):
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as s:
+                s.settimeout(0.2)
+                if s.connect_ex((host, port)) == 0:
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def _detect_ports_from_pm2_logs(app_names: list[str], timeout: int = DETECTION_TIMEOUT, assigned_ports: list[int] | None = None) -> list[int]:
+    """An instance's port is its assigned port once that accepts connections, or else the
+    first localhost URL it prints; logs are tailed incrementally, not re-read."""
     results: dict[str, int] = {}
-    port_pattern = re.compile(r"http[s]?://(?:localhost|127\.0\.0\.1):(\d+)", re.IGNORECASE)
+    port_pattern = re.compile(r"http[s]?://(?:localhost|127\.0\.0\.1|\[::1\]):(\d+)", re.IGNORECASE)
     ansi_escape = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+    tailers = {name: _LogTailer(_pm2_log_files(name)) for name in app_names}
 
     start_time = time.time()
     while time.time() - start_time < timeout:
-        for name in app_names:
+        for i, name in enumerate(app_names):
             if name in results:
                 continue
-            log_files = [
-                os.path.join(PM2_LOG_DIR, f"{name}-out.log"),
-                os.path.join(PM2_LOG_DIR, f"{name}-error.log"),
-            ]
-            for log_file in log_files:
-                if not os.path.exists(log_file):
-                    continue
-                try:
-                    with open(log_file, "r", encoding="utf-8", errors="ignore") as f:
-                        content = f.read()
-                        content = ansi_escape.sub('', content).strip()
-                        match = port_pattern.search(content)
-                        if match:
-                            results[name] = int(match.group(1))
-                            break
-                except Exception:
-                    pass
+            if assigned_ports and _port_open(assigned_ports[i]):
+                results[name] = assigned_ports[i]
+                continue
+            content = ansi_escape.sub('', tailers[name].read_new())
+            match = port_pattern.search(content)
+            if match:
+                results[name] = int(match.group(1))
         if len(results) == len(app_names):
             break
-        time.sleep(0.8)
+        time.sleep(0.2)
 
     return [results[name] for name in app_names if name in results]
 
 
-def start_multiple_webapps_pm2(num_instances: int, app_dir: str) -> list[int]:
+def _install_dependencies(app_dir: str, deps_key: str | None = None):
+    # The key is taken before installing, and the install is stored under that same key
+    deps_key = deps_key or dep_cache.cache_key(app_dir)
+    if not dep_cache.restore(app_dir, deps_key):
+        # Raises InstallError carrying every strategy's stderr, which ends up in LAUNCHING_FAILED
+        npm_install.install(app_dir)
+        dep_cache.save(app_dir, deps_key)
+
+
+def start_multiple_webapps_pm2(num_instances: int, app_dir: str, install: bool = True) -> list[int]:
     """Run multiple web applications with pm2
-    npm install -> make ecosystem.config.js -> pm2 start -> extract ports from logs
+    npm install (or restore cached node_modules) -> allocate ports -> make ecosystem.config.js -> pm2 start -> wait for the ports
     """
     app_dir = str(app_dir)
     Path(app_dir).mkdir(parents=True, exist_ok=True)
 
-    try:
-        _run_cmd("npm install", cwd=app_dir, check=True, timeout=600)
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
-        try:
-            _run_cmd("npm install --force", cwd=app_dir, check=True, timeout=600)
-        except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
-            _run_cmd("npm install --legacy-peer-deps", cwd=app_dir, check=True, timeout=600)
+    if install:
+        _install_dependencies(app_dir)
 
-    _remove_files_in_dir(PM2_LOG_DIR)
+    # Only this client's own logs are cleared; other pm2 apps on the machine are left alone
+    app_names = _pm2_app_names(num_instances)
+    os.makedirs(PM2_RUN_LOG_DIR, exist_ok=True)
+    for name in app_names:
+        for log_file in _pm2_log_files(name):
+            if os.path.exists(log_file):
+                os.remove(log_file)
 
     script_name = _read_package_script_name(app_dir)
-    ecosystem_path = _write_ecosystem_for_instances(app_dir, num_instances, script_name)
+    assigned_ports = _allocate_ports(num_instances)
+    ecosystem_path = _write_ecosystem_for_instances(app_dir, num_instances, script_name, assigned_ports)
 
-    app_names = [f"webapp-{i+1}" for i in range(num_instances)]
     _pm2_start(ecosystem_path, app_dir, app_names)
 
-    ports = _detect_ports_from_pm2_logs(app_names, timeout=DETECTION_TIMEOUT)
+    ports = _detect_ports_from_pm2_logs(app_names, timeout=DETECTION_TIMEOUT, assigned_ports=assigned_ports)
     print(f"PM2 ports: {ports}")
     return ports
 
@@ -212,7 +339,34 @@ def _pm2_list_names() -> list[str]:
         return []
 
 
-def stop_all_webapps_pm2(prefix: str = "webapp-") -> list[str]:
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def delete_orphaned_webapps() -> list[str]:
+    """Delete webapp-<pid>-* pm2 apps whose client process is gone (crashed or restarted)."""
+    orphaned = []
+    for name in _pm2_list_names():
+        match = re.match(r"^webapp-(\d+)-", name)
+        if match and int(match.group(1)) != os.getpid() and not _pid_alive(int(match.group(1))):
+            orphaned.append(name)
+    for name in orphaned:
+        try:
+            _run_cmd(f"pm2 delete {name}")
+        except Exception:
+            pass
+    if orphaned:
+        print(f"Deleted {len(orphaned)} pm2 app(s) left by exited clients: {', '.join(orphaned)}")
+    return orphaned
+
+
+def stop_all_webapps_pm2(prefix: str = PM2_APP_PREFIX) -> list[str]:
     names = [n for n in _pm2_list_names() if isinstance(n, str) and n.startswith(prefix)]
     for name in names:
         try:
@@ -221,6 +375,77 @@ def stop_all_webapps_pm2(prefix: str = "webapp-") -> list[str]:
             pass
     return names
 
+
+def start_round_webapps(num_instances: int, app_dir, changes: dict | None = None) -> list[int]:
+    """Instances serving this round's code. Front-end-only apps are built once and served
+    statically from a single port; others get `num_instances` dev servers. With `changes`
+    from an incremental workspace sync, running dev servers are kept when HMR can absorb
+    the edits, and npm install only reruns when the dependency manifest changed.
+    Raises CompileError before anything is (re)started when the code does not compile."""
+    global live_webapps
+    app_dir = str(app_dir)
+    deps_key = dep_cache.cache_key(app_dir)
+    live = live_webapps
+    same_workspace = changes is not None and live is not None and live["app_dir"] == app_dir
+    reuse = (same_workspace and live["mode"] == "dev" and not changes["restart"]
+             and len(live["ports"]) == num_instances and all(_port_open(port) for port in live["ports"]))
+    static = not reuse and static_serve.STATIC_SERVE and static_serve.is_frontend_only(app_dir)
+
+    if not reuse:
+        live_webapps = None
+        stop_all_webapps_pm2()
+        if not (same_workspace and live["deps_key"] == deps_key and (Path(app_dir) / "node_modules").is_dir()):
+            _install_dependencies(app_dir, deps_key)
+        if changes is not None:
+            # Remember the installed dependencies even if the compile gate stops this round
+            live_webapps = {"app_dir": app_dir, "ports": [], "deps_key": deps_key, "mode": None}
+
+    if reuse:
+        # The running dev server compiles just the changed modules; a full build would only slow the fast path
+        gate = compile_gate.check_dev_server(live["ports"][0], changes["written"])
+    else:
+        # The static build doubles as the gate's bundler check
+        gate = compile_gate.run(app_dir, out_dir=Path(app_dir) / static_serve.BUILD_DIR if static else None)
+
+    if reuse:
+        print(f"Keeping {num_instances} running instances, {len(changes['written']) + len(changes['removed'])} files changed")
+        # Give the dev servers' file watchers a moment to pick up the writes
+        time.sleep(0.5)
+        return live["ports"]
+
+    if static:
+        # Every agent shares the one server; a rebuild in place is picked up without restarting it
+        build_dir = Path(app_dir) / static_serve.BUILD_DIR if gate["build"] == "ok" else static_serve.build(app_dir)
+        ports = [static_server.serve(build_dir)]
+        mode = "static"
+    else:
+        static_server.stop()
+        ports = start_multiple_webapps_pm2(num_instances, app_dir, install=False)
+        mode = "dev"
+    print(f"Serving round in {mode} mode on ports {ports}")
+    if changes is not None:
+        live_webapps = {"app_dir": app_dir, "ports": ports, "deps_key": deps_key, "mode": mode}
+    return ports
+
+
+def finish_round_webapps():
+    """End-of-round cleanup; in incremental mode the instances stay up for the next round."""
+    global live_webapps
+    if INCREMENTAL_ROUNDS and live_webapps is not None:
+        return
+    live_webapps = None
+    stop_all_webapps_pm2()
+    static_server.stop()
+
+
+def _shutdown_webapps():
+    stop_all_webapps_pm2()
+    static_server.stop()
+    round_workspace.destroy()
+
+
+atexit.register(_shutdown_webapps)
+
 def read_json_as_string(file_path='req.json'):
     if os.path.exists(file_path):
         try:
@@ -231,14 +456,8 @@ def read_json_as_string(file_path='req.json'):
             return str(e)
     return None
 
-def validate_json_string(json_str):
-    try:
-        parsed_json = json.loads(json_str)
-        return True, parsed_json, None
-    except json.JSONDecodeError as e:
-        error_msg = {str(e)}
-        print(error_msg)
-        return False, None, error_msg
+def validate_json_string(json_str, stage=None, expect="array"):
+    return parse_stage_output(json_str, stage, expect)
 
 def save_json_if_absent(data, file_path='req.json'):
     if not os.path.exists(file_path):
@@ -246,6 +465,130 @@ def save_json_if_absent(data, file_path='req.json'):
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
 
+def _record_stage_timing(stage, bot=None, latency=None):
+    ttft = bot.last_ttft if bot else None
+    if bot and latency is None:
+        latency = bot.last_latency
+    textgen_timings[stage] = {
+        "ttft_seconds": round(ttft, 2) if ttft is not None else None,
+        "latency_seconds": round(latency, 2) if latency is not None else None,
+    }
+
+def generate_requirement_list_parallel(prompt, requirements, image_encoding=None, max_retries=3):
+    """Expand every high-level requirement with its own concurrent REQUIREMENT_LIST request.
+
+    Returns (is_valid, requirement_list, error_msg); the merged list keeps the input order.
+    """
+    requirement_items = json.loads(requirements) if isinstance(requirements, str) else requirements
+    bot = AsyncOpenAILLM(key, base_url=base_url, model=model)
+    semaphore = asyncio.Semaphore(REQUIREMENT_LIST_CONCURRENCY)
+    prompt_name = "REQUIREMENT_LIST_IMG" if image_encoding else "REQUIREMENT_LIST"
+
+    async def expand(index, requirement):
+        question = get_prompt(prompt_name, instruction=str(prompt), requirements=json.dumps([requirement], ensure_ascii=False))
+        error_msg = None
+        for attempt in range(max_retries):
+            async with semaphore:
+                try:
+                    response = await bot.ask(question, image_encoding=image_encoding or None, use_cache=attempt == 0)
+                except Exception as e:
+                    error_msg = str(e)
+                    print(f"Requirement {index + 1} expansion exception (attempt {attempt + 1}/{max_retries}): {error_msg}")
+                    continue
+            is_valid, parsed, error_msg = validate_json_string(response, "REQUIREMENT_LIST")
+            if is_valid:
+                return parsed
+            print(f"Requirement {index + 1} JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
+        raise ValueError(f"Requirement {index + 1} ({requirement}): {error_msg}")
+
+    async def expand_all():
+        return await asyncio.gather(*(expand(i, item) for i, item in enumerate(requirement_items)))
+
+    started = time.monotonic()
+    try:
+        expanded = run_async(expand_all())
+    except Exception as e:
+        return False, None, str(e)
+    finally:
+        _record_stage_timing("requirement_list", latency=time.monotonic() - started)
+    return True, [item for items in expanded for item in items], None
+
+def compile_test_criteria(test_criteria, max_retries=2):
+    """Compile each test criterion not compiled yet into a declarative Playwright test (COMPILE_TEST).
+
+    Every test is stored as soon as it validates, so rounds starting meanwhile already use it.
+    Returns the number of criteria that have a compiled test.
+    """
+    items = json.loads(test_criteria) if isinstance(test_criteria, str) else test_criteria
+    # Same serialisation valiv2 passes to the agents, so the store keys match
+    criteria = [json.dumps(item) for item in items]
+    pending = [c for c in criteria if compiled_test_store.get(c) is None]
+    if not COMPILE_TESTS or not pending:
+        return len(criteria) - len(pending)
+    bot = AsyncOpenAILLM(key, base_url=base_url, model=model)
+    semaphore = asyncio.Semaphore(COMPILE_CONCURRENCY)
+
+    async def compile_one(index, criterion):
+        question = get_prompt("COMPILE_TEST", criteria=criterion)
+        error_msg = None
+        for attempt in range(max_retries):
+            async with semaphore:
+                try:
+                    response = await bot.ask(question, use_cache=attempt == 0)
+                except Exception as e:
+                    error_msg = str(e)
+                    print(f"Test {index + 1} compilation exception (attempt {attempt + 1}/{max_retries}): {error_msg}")
+                    continue
+            is_valid, parsed, error_msg = validate_json_string(response, "COMPILED_TEST", expect="object")
+            if is_valid:
+                reason = compiled_tests.missing_assertions(parsed, criterion)
+                if parsed["compilable"] and reason is not None:
+                    # Without a check per expected outcome a pass would prove nothing
+                    print(f"Test {index + 1} compiled without enough assertions ({reason}), left to the agent")
+                    parsed = {"compilable": False, "steps": parsed["steps"], "reason": reason}
+                compiled_test_store.put(criterion, parsed)
+                return parsed["compilable"]
+            print(f"Test {index + 1} JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
+        print(f"Test {index + 1} left to the agent: {error_msg}")
+        return False
+
+    async def compile_all():
+        return await asyncio.gather(*(compile_one(i, c) for i, c in enumerate(pending)))
+
+    started = time.monotonic()
+    try:
+        compiled = run_async(compile_all())
+    finally:
+        _record_stage_timing("compile_tests", latency=time.monotonic() - started)
+    print(f"Compiled {sum(compiled)}/{len(pending)} test criteria into Playwright tests")
+    return len(criteria) - len(pending) + sum(compiled)
+
+def _smoke_plans(test_cases):
+    """(plans, borrowed): smoke assertions per test case, from its own static_description or,
+    when the test criteria line up one-to-one with it, the requirement_list entry at the same
+    index; `borrowed` holds the indices whose plan came from requirement_list."""
+    requirement_list = []
+    if textgen_graph is not None and textgen_graph.done("requirement_list"):
+        try:
+            requirement_list = json.loads(textgen_graph.result("requirement_list") or "[]")
+        except Exception:
+            requirement_list = []
+    aligned = len(requirement_list) == len(test_cases)
+    plans, borrowed = [], set()
+    for index, item in enumerate(test_cases):
+        if isinstance(item, dict) and item.get("static_description"):
+            source = item
+        else:
+            source = requirement_list[index] if aligned else {}
+            borrowed.add(index)
+        source = source if isinstance(source, dict) else {}
+        plans.append(smoke.plan(source.get("static_description"), ignore=(source.get("resource_dependency") or {}).keys()))
+    return plans, borrowed
+
+def _fail_fast_reached(failed, total):
+    return bool((FAIL_FAST_COUNT and failed >= FAIL_FAST_COUNT)
+                or (FAIL_FAST_RATIO and total and failed / total >= FAIL_FAST_RATIO))
+
 def update_csv_results(round_num, folder_name, success_count, fail_count):
     global csv_file_path
     if csv_file_path and csv_file_path.exists():
@@ -259,29 +602,24 @@ def update_csv_results(round_num, folder_name, success_count, fail_count):
             print(f"Error when updating the csv {str(e)}")
 
 
-def capture_screenshot_as_base64(url, save_path=None):
+def capture_screenshot_with_signals(url, save_path=None):
+    """Screenshot `url` as base64 (None on failure) together with the load signals
+    collected while the page loaded (see load_check)."""
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1920, "height": 1080})
-            page.goto(url, wait_until="networkidle")
-            page.wait_for_load_state("networkidle")
-            screenshot_bytes = page.screenshot(full_page=True, type="png")
-
-            if save_path:
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                with open(save_path, "wb") as f:
-                    f.write(screenshot_bytes)
-
-            browser.close()
-            base64_string = base64.b64encode(screenshot_bytes).decode('utf-8')
-
-            return base64_string
-
+        shot = screenshot_service.capture(url, png_copy=save_path is not None)
     except Exception as e:
         print(f"Fail to capture a screenshot: {str(e)}")
-        return None
+        return None, load_check.new_signals(url)
+    if not shot["images"]:
+        return None, shot["signals"]
+    print(f"Screenshot of {url}: {shot['format']}, {len(shot['images'][0]) * 3 // 4} bytes, page height {shot['page_height']}px"
+          f"{' (truncated)' if shot['truncated'] else ''} in {shot['seconds']}s")
+
+    if save_path:
+        os.makedirs(Path(save_path).parent, exist_ok=True)
+        with open(save_path, "wb") as f:
+            f.write(base64.b64decode(shot["png"]))
+    return shot["images"][0], shot["signals"]
 
 
 @app.route('/')
@@ -291,13 +629,19 @@ def index():
 @app.route('/config', methods=['GET', 'POST'])
 def config():
     """Configure parallel count, round limit and max wait time parameters"""
-    global PARALLEL_AGENT_COUNT, round_limit, vali_run_counter, max_wait_time
+    global PARALLEL_AGENT_COUNT, round_limit, vali_run_counter, max_wait_time, artifact_timeout, INCREMENTAL_ROUNDS, TEST_SELECTION
+    global FAIL_FAST_COUNT, FAIL_FAST_RATIO
     
     if request.method == 'POST':
         data = request.json
         new_count = data.get('parallel_count')
         new_round_limit = data.get('round_limit')
         new_max_wait_time = data.get('max_wait_time')
+        new_artifact_timeout = data.get('artifact_timeout')
+        new_incremental_rounds = data.get('incremental_rounds')
+        new_test_selection = data.get('test_selection')
+        new_fail_fast_count = data.get('fail_fast_count')
+        new_fail_fast_ratio = data.get('fail_fast_ratio')
         
         # Update parallel count if provided
         if new_count is not None:
@@ -328,6 +672,54 @@ def config():
                     "success": False, 
                     "message": "Invalid max wait time, must be a positive integer"
                 })
+
+        # Update artifact wait timeout if provided
+        if new_artifact_timeout is not None:
+            if isinstance(new_artifact_timeout, int) and new_artifact_timeout > 0:
+                artifact_timeout = new_artifact_timeout
+            else:
+                return jsonify({
+                    "success": False, 
+                    "message": "Invalid artifact timeout, must be a positive integer"
+                })
+
+        # Toggle incremental round updates if provided
+        if new_incremental_rounds is not None:
+            if isinstance(new_incremental_rounds, bool):
+                INCREMENTAL_ROUNDS = new_incremental_rounds
+            else:
+                return jsonify({
+                    "success": False, 
+                    "message": "Invalid incremental rounds flag, must be a boolean"
+                })
+
+        # Toggle regression-test selection if provided
+        if new_test_selection is not None:
+            if isinstance(new_test_selection, bool):
+                TEST_SELECTION = new_test_selection
+            else:
+                return jsonify({
+                    "success": False, 
+                    "message": "Invalid test selection flag, must be a boolean"
+                })
+
+        # Update fail-fast thresholds if provided (0 disables either one)
+        if new_fail_fast_count is not None:
+            if isinstance(new_fail_fast_count, int) and not isinstance(new_fail_fast_count, bool) and new_fail_fast_count >= 0:
+                FAIL_FAST_COUNT = new_fail_fast_count
+            else:
+                return jsonify({
+                    "success": False, 
+                    "message": "Invalid fail-fast count, must be a non-negative integer"
+                })
+        if new_fail_fast_ratio is not None:
+            if isinstance(new_fail_fast_ratio, (int, float)) and not isinstance(new_fail_fast_ratio, bool) and 0 <= new_fail_fast_ratio <= 1:
+                FAIL_FAST_RATIO = float(new_fail_fast_ratio)
+            else:
+                return jsonify({
+                    "success": False, 
+                    "message": "Invalid fail-fast ratio, must be a number between 0 and 1"
+                })
         
         return jsonify({
             "success": True, 
@@ -335,6 +727,11 @@ def config():
             "current_parallel_count": PARALLEL_AGENT_COUNT,
             "current_round_limit": round_limit,
             "current_max_wait_time": max_wait_time,
+            "current_artifact_timeout": artifact_timeout,
+            "current_incremental_rounds": INCREMENTAL_ROUNDS,
+            "current_test_selection": TEST_SELECTION,
+            "current_fail_fast_count": FAIL_FAST_COUNT,
+            "current_fail_fast_ratio": FAIL_FAST_RATIO,
             "current_round_counter": vali_run_counter
         })
     
@@ -343,6 +740,11 @@ def config():
         "current_parallel_count": PARALLEL_AGENT_COUNT,
         "current_round_limit": round_limit,
         "current_max_wait_time": max_wait_time,
+        "current_artifact_timeout": artifact_timeout,
+        "current_incremental_rounds": INCREMENTAL_ROUNDS,
+        "current_test_selection": TEST_SELECTION,
+        "current_fail_fast_count": FAIL_FAST_COUNT,
+        "current_fail_fast_ratio": FAIL_FAST_RATIO,
         "current_round_counter": vali_run_counter,
         "message": f"Configuration loaded successfully。"
     })
@@ -350,7 +752,7 @@ def config():
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get agent status"""
-    global agent_execution_status, round_limit, vali_run_counter
+    global agent_execution_status, round_limit, vali_run_counter, textgen_timings
 
     execution_time = None
     if agent_execution_status["start_time"] and agent_execution_status["end_time"]:
@@ -363,7 +765,13 @@ def get_status():
         "val_round_limit": round_limit,
         **agent_execution_status,
         "execution_time_seconds": execution_time,
-        "parallel_count": PARALLEL_AGENT_COUNT
+        "parallel_count": PARALLEL_AGENT_COUNT,
+        "textgen_timings": textgen_timings,
+        "browser_pool": browser_pool.stats(),
+        "dependency_cache": dep_cache.get_stats(),
+        "replay": replay.get_stats(),
+        "compiled_tests": compiled_tests.get_stats(),
+        "test_selection": test_impact.get_stats()
     }
     
     return jsonify(status_info)
@@ -461,6 +869,7 @@ def clear_files():
 def textgenv1():
     global last_called_route, model, base_url, key, provider, image
     last_called_route = "textgenv1"
+    _reset()
     
     data = request.json
     prompt = data.get('prompt')
@@ -554,6 +963,7 @@ def textgenv1():
 def textgen():
     global last_called_route
     last_called_route = "textgen"
+    _reset()
 
     data = request.json
     prompt = data.get('prompt')
@@ -563,8 +973,9 @@ def textgen():
 
 
 def direct_textgen(selected_model, prompt, image_encoding=None):
-    global model, base_url, key, provider, image, id
+    global model, base_url, key, provider, image, id, textgen_timings
     image = image_encoding
+    textgen_timings = {}
 
     if selected_model == "openai":
         model = "gpt-4.1"
@@ -587,7 +998,6 @@ def direct_textgen(selected_model, prompt, image_encoding=None):
         key = os.getenv("TOGETHER_API_KEY")
         provider = "Together"
         image = ""
-    bot = OpenAILLM(key, base_url=base_url, model=model)
 
     if os.path.exists(f'{id}_prompt_{selected_model}.txt'):
          with open(f'{id}_prompt_{selected_model}.txt', 'r', encoding='utf-8') as f:
@@ -597,100 +1007,153 @@ def direct_textgen(selected_model, prompt, image_encoding=None):
         with open(f'{id}_prompt_{selected_model}.txt', "w", encoding="utf-8") as f:
             f.write(prompt)
 
+    # requirements -> {dispatch, requirement_list -> test_criteria}: bolt starts generating
+    # as soon as the requirements exist, while the test criteria are derived in parallel.
+    # Only dispatch is awaited here; valiv2 waits for the test criteria on the graph.
+    global textgen_graph
+    textgen_graph = StageGraph("textgen")
+    textgen_graph.add("requirements", lambda r: _generate_requirements(selected_model, prompt))
+    textgen_graph.add("dispatch", lambda r: _dispatch_generation(prompt, r["requirements"]), deps=["requirements"])
+    textgen_graph.add("requirement_list", lambda r: _generate_requirement_list(selected_model, prompt, r["requirements"]), deps=["requirements"])
+    textgen_graph.add("test_criteria", lambda r: _generate_test_criteria(selected_model, prompt, r["requirements"], r["requirement_list"]), deps=["requirements", "requirement_list"])
+    # Not awaited below: tests are compiled in the background while bolt generates the app
+    textgen_graph.add("compile_tests", lambda r: compile_test_criteria(r["test_criteria"]), deps=["test_criteria"])
+    textgen_graph.start()
+
+    try:
+        requirements = textgen_graph.result("requirements")
+        result_json, dispatch_error = textgen_graph.result("dispatch")
+    except StageError as e:
+        return str(e)
+    except Exception as e:
+        return f"Text generation failed: {str(e)}"
+    finally:
+        print(f"Stage timings: {textgen_graph.timings()}")
+
+    response = str(requirements)
+    if dispatch_error:
+        return jsonify({"success": False, "error": dispatch_error, "response": response, "data": result_json})
+    return jsonify({"success": True, "response": response})
+
+
+def _generate_requirements(selected_model, prompt):
     cached_requirements = read_json_as_string(f'{id}_requirements_{selected_model}.json')
     if cached_requirements is not None:
         print("Use cached requirements")
-        requirements = cached_requirements
-    else:
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                if image:
-                    requirements = bot.ask(get_prompt("REQUIREMENT_DIVIDER_IMG", instruction=str(prompt)), image_encoding=image, verbose=True)
-                else:
-                    requirements = bot.ask(get_prompt("REQUIREMENT_DIVIDER", instruction=str(prompt)), verbose=True)
-                
-                is_valid, parsed_requirements, error_msg = validate_json_string(requirements)
-                if is_valid:
-                    print(f"Requirements JSON validation successful (attempt {attempt + 1}/{max_retries})")
-                    save_json_if_absent(parsed_requirements, f'{id}_requirements_{selected_model}.json')
-                    requirements = json.dumps(parsed_requirements, ensure_ascii=False)
-                    break
-                else:
-                    print(f"Requirements JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                    if attempt == max_retries - 1:
-                        return f"Requirements JSON validation failed, maximum retry attempts reached: {error_msg}"
-                    
-            except Exception as e:
+        return cached_requirements
+
+    bot = OpenAILLM(key, base_url=base_url, model=model)
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            if image:
+                requirements = bot.ask_stream(get_prompt("REQUIREMENT_DIVIDER_IMG", instruction=str(prompt)), image_encoding=image, verbose=True, use_cache=attempt == 0, lenient=True)
+            else:
+                requirements = bot.ask_stream(get_prompt("REQUIREMENT_DIVIDER", instruction=str(prompt)), verbose=True, use_cache=attempt == 0, lenient=True)
+
+            _record_stage_timing("requirements", bot)
+            is_valid, parsed_requirements, error_msg = validate_json_string(requirements, "REQUIREMENTS")
+            if is_valid:
+                print(f"Requirements JSON validation successful (attempt {attempt + 1}/{max_retries})")
+                save_json_if_absent(parsed_requirements, f'{id}_requirements_{selected_model}.json')
+                return json.dumps(parsed_requirements, ensure_ascii=False)
+            else:
+                print(f"Requirements JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
                 if attempt == max_retries - 1:
-                    return f"Requirements generation failed: {str(e)}"
-                print(f"Requirements generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                    raise StageError(f"Requirements JSON validation failed, maximum retry attempts reached: {error_msg}")
 
-    if selected_model != "deepseek":
-        cached_requirement_list = read_json_as_string(f'{id}_requirement_list_{selected_model}.json')
-        if cached_requirement_list is not None:
-            requirement_list = cached_requirement_list
-        else:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if image:
-                        requirement_list = bot.ask(get_prompt("REQUIREMENT_LIST_IMG", instruction=str(prompt), requirements=str(requirements)), image_encoding=image, verbose=True)
-                    else:
-                        requirement_list = bot.ask(get_prompt("REQUIREMENT_LIST", instruction=str(prompt), requirements=str(requirements)), verbose=True)
-
-                    is_valid, parsed_requirement_list, error_msg = validate_json_string(requirement_list)
-                    if is_valid:
-                        print(f"Requirement list JSON validation successful (attempt {attempt + 1}/{max_retries})")
-                        save_json_if_absent(parsed_requirement_list, f'{id}_requirement_list_{selected_model}.json')
-                        requirement_list = json.dumps(parsed_requirement_list, ensure_ascii=False)
-                        break
-                    else:
-                        print(f"Requirement list JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                        if attempt == max_retries - 1:
-                            return f"Requirement list JSON validation failed, maximum retry attempts reached: {error_msg}"
+        except StageError:
+            raise
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise StageError(f"Requirements generation failed: {str(e)}")
+            print(f"Requirements generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
 
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        return f"Requirement list generation failed: {str(e)}"
-                    print(f"Requirement list generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
-    else:
-        requirement_list = ""
 
+def _generate_requirement_list(selected_model, prompt, requirements):
+    if selected_model == "deepseek":
+        return ""
+
+    cached_requirement_list = read_json_as_string(f'{id}_requirement_list_{selected_model}.json')
+    if cached_requirement_list is not None:
+        return cached_requirement_list
+
+    if REQUIREMENT_LIST_PARALLEL:
+        is_valid, parsed_requirement_list, error_msg = generate_requirement_list_parallel(prompt, requirements, image_encoding=image)
+        if not is_valid:
+            raise StageError(f"Requirement list generation failed: {error_msg}")
+        print(f"Requirement list generated for {len(parsed_requirement_list)} requirements in parallel")
+        save_json_if_absent(parsed_requirement_list, f'{id}_requirement_list_{selected_model}.json')
+        return json.dumps(parsed_requirement_list, ensure_ascii=False)
+
+    bot = OpenAILLM(key, base_url=base_url, model=model)
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            if image:
+                requirement_list = bot.ask_stream(get_prompt("REQUIREMENT_LIST_IMG", instruction=str(prompt), requirements=str(requirements)), image_encoding=image, verbose=True, use_cache=attempt == 0, lenient=True)
+            else:
+                requirement_list = bot.ask_stream(get_prompt("REQUIREMENT_LIST", instruction=str(prompt), requirements=str(requirements)), verbose=True, use_cache=attempt == 0, lenient=True)
+
+            _record_stage_timing("requirement_list", bot)
+            is_valid, parsed_requirement_list, error_msg = validate_json_string(requirement_list, "REQUIREMENT_LIST")
+            if is_valid:
+                print(f"Requirement list JSON validation successful (attempt {attempt + 1}/{max_retries})")
+                save_json_if_absent(parsed_requirement_list, f'{id}_requirement_list_{selected_model}.json')
+                return json.dumps(parsed_requirement_list, ensure_ascii=False)
+            else:
+                print(f"Requirement list JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
+                if attempt == max_retries - 1:
+                    raise StageError(f"Requirement list JSON validation failed, maximum retry attempts reached: {error_msg}")
+
+        except StageError:
+            raise
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise StageError(f"Requirement list generation failed: {str(e)}")
+            print(f"Requirement list generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
+
+
+def _generate_test_criteria(selected_model, prompt, requirements, requirement_list):
     global global_test_criteria
     cached_test_criteria = read_json_as_string(f'{id}_test_criteria_{selected_model}.json')
     if cached_test_criteria is not None:
-        cached_test_criteria = json.loads(cached_test_criteria)
-        global_test_criteria = cached_test_criteria
-    else:
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                if image:
-                    global_test_criteria = bot.ask(get_prompt("TEST_CRITERIA_IMG", instruction=str(prompt), requirements=str(requirements), requirement_list=str(requirement_list)), image_encoding=image, verbose=True)
-                if selected_model == "deepseek":
-                    global_test_criteria = bot.ask(get_prompt("TEST_CRITERIA_DEEPSEEK", instruction=str(prompt), requirements=str(requirements)), verbose=True)
-                else:
-                    global_test_criteria = bot.ask(get_prompt("TEST_CRITERIA", instruction=str(prompt), requirements=str(requirements), requirement_list=str(requirement_list)), verbose=True)
-                
-                is_valid, parsed_test_criteria, error_msg = validate_json_string(global_test_criteria)
-                if is_valid:
-                    print(f"Test criteria JSON validation successful (attempt {attempt + 1}/{max_retries})")
-                    save_json_if_absent(parsed_test_criteria, f'{id}_test_criteria_{selected_model}.json')
-                    global_test_criteria = parsed_test_criteria
-                    break
-                else:
-                    print(f"Test criteria JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                    if attempt == max_retries - 1:
-                        return f"Test criteria JSON validation failed, maximum retry attempts reached: {error_msg}"
-                    
-            except Exception as e:
+        global_test_criteria = json.loads(cached_test_criteria)
+        return global_test_criteria
+
+    bot = OpenAILLM(key, base_url=base_url, model=model)
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            if image:
+                test_criteria = bot.ask_stream(get_prompt("TEST_CRITERIA_IMG", instruction=str(prompt), requirements=str(requirements), requirement_list=str(requirement_list)), image_encoding=image, verbose=True, use_cache=attempt == 0, lenient=True)
+            if selected_model == "deepseek":
+                test_criteria = bot.ask_stream(get_prompt("TEST_CRITERIA_DEEPSEEK", instruction=str(prompt), requirements=str(requirements)), verbose=True, use_cache=attempt == 0, lenient=True)
+            else:
+                test_criteria = bot.ask_stream(get_prompt("TEST_CRITERIA", instruction=str(prompt), requirements=str(requirements), requirement_list=str(requirement_list)), verbose=True, use_cache=attempt == 0, lenient=True)
+
+            _record_stage_timing("test_criteria", bot)
+            is_valid, parsed_test_criteria, error_msg = validate_json_string(test_criteria, "TEST_CRITERIA_DEEPSEEK" if selected_model == "deepseek" else "TEST_CRITERIA")
+            if is_valid:
+                print(f"Test criteria JSON validation successful (attempt {attempt + 1}/{max_retries})")
+                save_json_if_absent(parsed_test_criteria, f'{id}_test_criteria_{selected_model}.json')
+                global_test_criteria = parsed_test_criteria
+                return global_test_criteria
+            else:
+                print(f"Test criteria JSON validation failed (attempt {attempt + 1}/{max_retries}): {error_msg}")
                 if attempt == max_retries - 1:
-                    return f"Test criteria generation failed: {str(e)}"
-                print(f"Test criteria generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                    raise StageError(f"Test criteria JSON validation failed, maximum retry attempts reached: {error_msg}")
 
-    response = str(requirements) + str(requirement_list) + str(global_test_criteria)
+        except StageError:
+            raise
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise StageError(f"Test criteria generation failed: {str(e)}")
+            print(f"Test criteria generation exception (attempt {attempt + 1}/{max_retries}): {str(e)}")
 
+
+def _dispatch_generation(prompt, requirements):
+    """POST the WEB_GENERATE_MUL prompt to bolt; returns (result_json, error or None)."""
     if image:
         result_json = {
             "model": model,
@@ -717,18 +1180,34 @@ def direct_textgen(selected_model, prompt, image_encoding=None):
             headers={"Content-Type": "application/json"}
         )
         external_response.raise_for_status()
-        return jsonify({"success": True, "response": response})
+        print("Generation request dispatched to bolt")
+        return result_json, None
     except requests.exceptions.RequestException as e:
-        return jsonify({"success": False, "error": str(e), "response": response, "data": result_json})
+        return result_json, str(e)
 
 
+def _wait_for_test_criteria(timeout=None):
+    """Block until the background test-criteria stage of the last /textgen has finished."""
+    if textgen_graph is None:
+        return global_test_criteria
+    return textgen_graph.result("test_criteria", timeout=timeout)
 
 
 @app.route('/vali', methods=['GET'])
 def vali():
-    time.sleep(16)
-    global last_called_route, vali_run_counter, csv_file_path, round_limit, id
-    
+    global last_called_route, vali_run_counter, csv_file_path, round_limit, id, artifact_timeout
+    file_name = request.args.get('fileName')
+    if file_name:
+        import urllib.parse
+        zip_path = Path.home() / "Downloads" / urllib.parse.unquote(file_name)
+        # Checked before the round is counted: a partial zip would fail later with an unrelated error
+        if not wait_for_artifact(zip_path, timeout=artifact_timeout):
+            return jsonify({
+                "message": "error",
+                "status": "ARTIFACT_TIMEOUT",
+                "result": f"{zip_path.name} did not arrive as a complete zip archive within {artifact_timeout:.0f}s",
+            }), 504
+
     vali_run_counter += 1
     print(f"{vali_run_counter} validation")
     
@@ -778,41 +1257,78 @@ def valiv2():
         extract_folder_name = extract_folder_name.replace('&', '_and_').replace(' ', '_')
         extract_path = downloads_path / extract_folder_name
 
+        workspace_changes = None
         try:
-            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
+            if INCREMENTAL_ROUNDS:
+                workspace_changes = round_workspace.sync(zip_file_path)
+                extract_path = round_workspace.path
+            else:
+                with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+                    zip_ref.extractall(extract_path)
         except Exception as e:
             return jsonify({"message": "error", "result": f"Fail to unzip: {str(e)}"})
+        changed_files = impact_index.begin_round(zip_file_path)
 
-        global global_test_criteria, compare_result, image, model, base_url, key, provider
+        global global_test_criteria, compare_result, image, model, base_url, key, provider, agent_execution_status
         compare_result=None
 
-        test_cases = global_test_criteria
+        # Non-existent packages or versions fail here in milliseconds instead of after npm install
+        missing_dependencies = dep_preflight.check(extract_path)
+        if missing_dependencies:
+            return jsonify({"message": "continue", "result": get_prompt("LAUNCHING_FAILED", errors="\n".join(missing_dependencies)), "model": model, "provider": provider})
+
+        try:
+            test_cases = _wait_for_test_criteria(timeout=max_wait_time)
+        except Exception as e:
+            return jsonify({"message": "error", "result": f"Test criteria unavailable: {str(e)}"})
         test_array = [json.dumps(item) for item in test_cases]
         total_test_count = len(test_array)
+        # fullRun=1 re-runs every criterion regardless of the diff
+        run_indices, carried_verdicts = impact_index.select(
+            test_array, changed_files, force=not TEST_SELECTION or request.args.get('fullRun') == '1')
+        visited_routes = {}
         
         print(f"Performing {total_test_count} test cases")
         try:
             os.chdir(extract_path)
             count = PARALLEL_AGENT_COUNT
+            browser_pool.resize(count)
 
-            app_names = [f"webapp-{i+1}" for i in range(count)]
+            app_names = _pm2_app_names(count)
             
 
             try:
-                ports = start_multiple_webapps_pm2(count, str(extract_path))
+                ports = start_round_webapps(count, extract_path, workspace_changes)
                 if not ports:
                     return jsonify({"message": "error", "result": "PORT not found, check logs ~/.pm2/logs"})
+            except npm_install.InstallError as e:
+                return jsonify({"message": "continue", "result": get_prompt("LAUNCHING_FAILED", errors=str(e)), "model": model, "provider": provider})
             except Exception as e:
                 return jsonify({"message": "continue", "result": get_prompt("LOADING_FAILED", detail=str(e)), "model": model, "provider": provider})
 
             print(f"{len(ports)} applications running, ports: {ports}")
 
+            # Warm up every instance (and trigger Vite's on-demand compilation) without an agent
+            readiness = probe_instances(ports)
+            agent_execution_status["instance_readiness"] = readiness
+            ready_ports = [r["port"] for r in readiness if r["ready"]]
+            if not ready_ports:
+                finish_round_webapps()
+                detail = "\n".join(f"Port {r['port']}: {r['error']}" for r in readiness)
+                return jsonify({"message": "continue", "result": get_prompt("LOADING_FAILED", detail=detail), "model": model, "provider": provider})
+            ports = ready_ports
+
             screenshot_name = file_name.replace('.zip', '.png')
             screenshot_path = downloads_path / screenshot_name
-            screenshot_base64 = capture_screenshot_as_base64(f"http://localhost:{ports[0]}", str(screenshot_path))
-
+            screenshot_base64, load_signals = capture_screenshot_with_signals(f"http://localhost:{ports[0]}", str(screenshot_path))
+            agent_execution_status["load_signals"] = load_signals
 
+            # Obvious failures (HTTP errors, error overlay, nothing rendered) skip the vision judge
+            load_verdict, load_detail = load_check.assess(load_signals)
+            if load_verdict == "failed":
+                print("Page failed to load (detected locally), skipping the screenshot judge")
+                finish_round_webapps()
+                return jsonify({"message": "continue", "result": get_prompt("LOADING_FAILED", detail=load_detail), "model": model, "provider": provider})
 
             if screenshot_base64:
                 bot = OpenAILLM(key=os.getenv("ANTHROPIC_API_KEY"), base_url="https://api.anthropic.com/v1/", model="claude-sonnet-4-20250514")
@@ -821,7 +1337,9 @@ def valiv2():
                         response = bot.ask(get_prompt("SCREENSHOT_IMG"), screenshot_base64, image, True)
                     else:
                         response = bot.ask(get_prompt("SCREENSHOT"), image_encoding=screenshot_base64, verbose=True)
-                    data = json.loads(response)
+                    is_valid, data, error_msg = validate_json_string(response, "SCREENSHOT", expect="object")
+                    if not is_valid:
+                        raise Exception(f"Invalid screenshot verdict: {error_msg}")
                     if data.get("loading_success") == "True":
                         if image and data.get("detail"):
                             compare_result = data.get("detail")
@@ -830,19 +1348,19 @@ def valiv2():
                             print("Page loaded correctly, proceeding with tests...")
                     elif data.get("loading_success") == "False":
                         detail = data.get("detail")
-                        stop_all_webapps_pm2()
+                        finish_round_webapps()
                         return jsonify({"message": "continue", "result": get_prompt("LOADING_FAILED", detail=detail), "model": model, "provider": provider})
                     else:
                         raise Exception("Error: Invalid value for 'loading_success' key.")
                 except (json.JSONDecodeError, AttributeError, Exception) as e:
-                    stop_all_webapps_pm2()
+                    finish_round_webapps()
                     return jsonify({"message": "error", "result": f"Initial image validation failed: {str(e)}"})
             else:
                 response = "Fail to capture screenshot"
-                stop_all_webapps_pm2()
+                finish_round_webapps()
                 return jsonify({"message": "continue", "result": get_prompt("LOADING_FAILED", detail=response), "model": model, "provider": provider})
 
-            global browser_session, agent_execution_status
+            global browser_session
 
             agent_execution_status.update({
                 "is_running": True,
@@ -853,16 +1371,39 @@ def valiv2():
                 "start_time": time.time(),
                 "end_time": None,
                 "current_results": [],
-                "current_round": 0
+                "current_round": 0,
+                "stopped_early": False
             })
 
-            async def run_single_agent(agent_id: int, test_criteria: str, target_url: str):
+            async def run_single_agent(agent_id: int, test_criteria: str, target_url: str, log_name: str | None = None):
                 global model
                 individual_browser_session = None
+                slot = None
                 try:
-                    individual_browser_session = BrowserSession(
-                        executable_path='/Applications/Google Chrome.app/Contents/MacOS/Google Chrome'
-                    )
+                    slot = await browser_pool.acquire()
+
+                    # A test this criterion passed before is replayed without the LLM first
+                    script = replay_store.get(test_criteria)
+                    if script is not None:
+                        outcome = await replay.replay(script, target_url, slot.endpoint)
+                        if outcome["passed"]:
+                            visited_routes[test_criteria] = test_impact.routes_from_replay(script)
+                            print(f"Agent {agent_id} replayed {outcome['steps']} recorded steps in {outcome['seconds']}s: Success")
+                            return "Success"
+                        print(f"Agent {agent_id} replay failed ({outcome['error']}), running the agent")
+
+                    # Then the test compiled from the criterion; its failures are not trusted either way
+                    compiled = compiled_test_store.get(test_criteria)
+                    if (compiled is not None and compiled["compilable"] and compiled["steps"]
+                            and compiled_tests.missing_assertions(compiled, test_criteria) is None):
+                        outcome = await compiled_tests.run(compiled, target_url, slot.endpoint)
+                        if outcome["passed"]:
+                            visited_routes[test_criteria] = test_impact.routes_from_compiled(compiled)
+                            print(f"Agent {agent_id} compiled test passed in {outcome['seconds']}s: Success")
+                            return "Success"
+                        print(f"Agent {agent_id} compiled test failed ({outcome['error']}), running the agent")
+
+                    individual_browser_session = await browser_pool.new_session(slot)
                     
                     individual_llm = ChatAnthropic(
                         model="claude-sonnet-4-20250514",
@@ -892,8 +1433,11 @@ def valiv2():
                     final_result = result.final_result()
                     print(f"Agent {agent_id} completed: {final_result}")
                     
-                    log_filename = f"log/browser_use_log_agent_{agent_id}_round_{agent_execution_status['current_round']}"
+                    log_filename = f"log/browser_use_log_agent_{agent_id}_{log_name or 'round_' + str(agent_execution_status['current_round'])}"
                     result.save_to_file(log_filename)
+                    visited_routes[test_criteria] = test_impact.routes_from_agent(result, target_url.rstrip("/"))
+                    if final_result == "Success":
+                        await replay_store.record(test_criteria, result, target_url, slot.endpoint)
                     
                     return final_result
 
@@ -902,11 +1446,35 @@ def valiv2():
                     return f"Error: {str(e)}"
 
                 finally:
+                    if slot is not None:
+                        try:
+                            await browser_pool.reset(slot, individual_browser_session, [target_url])
+                        finally:
+                            browser_pool.release(slot)
+
+            async def _update_impact_index(results_by_index):
+                """Map the criteria run this round to the files their visited routes loaded."""
+                # Tests cut off by fail-fast were not checked against this build; "Not run" re-runs them next round
+                verdicts = {
+                    test_array[i]: "Not run" if results_by_index[i] is None else "Success" if results_by_index[i] == "" else "Failure"
+                    for i in run_indices
+                }
+                routes = {
+                    criterion: list(dict.fromkeys(["/"] + visited_routes[criterion]))
+                    for criterion in verdicts if criterion in visited_routes
+                }
+                footprints = {}
+                all_routes = sorted({route for visited in routes.values() for route in visited})
+                if all_routes:
+                    slot = await browser_pool.acquire()
                     try:
-                        if individual_browser_session is not None:
-                            await individual_browser_session.close()
-                    except Exception:
-                        pass
+                        bundle_dir = static_server.root if static_server.port == ports[0] else None
+                        footprints = await test_impact.crawl(all_routes, f"http://localhost:{ports[0]}", extract_path, slot.endpoint, bundle_dir)
+                    except Exception as e:
+                        print(f"Footprint crawl failed: {str(e)}")
+                    finally:
+                        browser_pool.release(slot)
+                impact_index.finish_round(verdicts, routes, footprints)
 
             async def run_test_rounds():
                 global agent_execution_status, provider, model
@@ -914,96 +1482,119 @@ def valiv2():
                 successful_tests = 0
                 failed_tests = 0
                 all_results = []
-                current_test_index = 0
-                round_number = 0
 
                 print(f"\n=== STARTING TESTING ===")
-                current_round_tests = PARALLEL_AGENT_COUNT
 
-                round_urls = []
-                round_tasks = """You don't need to run any test or do anything, just skip and return a "Success" quickly."""
+                results_by_index = [None] * total_test_count
+                agent_execution_status['current_round'] = 1
 
-                for i in range(current_round_tests):
-                    target_url = f"http://localhost:{ports[i % len(ports)]}"
-                    round_urls.append(target_url)
-
-                    print(f"Test cases {i + 1} -> {target_url}")
-
-                tasks = []
-                for i in range(current_round_tests):
-                    task = run_single_agent(i + 1, round_tasks, round_urls[i])
-                    tasks.append(task)
+                # Criteria untouched by this round's changes keep their last verdict
+                for test_index, verdict in carried_verdicts.items():
+                    completed_tests += 1
+                    if verdict == "Success":
+                        successful_tests += 1
+                        results_by_index[test_index] = ""
+                    else:
+                        failed_tests += 1
+                        results_by_index[test_index] = f"Test {test_index + 1}: Failure - {verdict}"
 
-                print(f"Paralleling {len(tasks)} paddings...")
-                await asyncio.gather(*tasks, return_exceptions=True)
-                print("All paddings done.")
+                # Tier 1: DOM smoke checks from the static descriptions; only routes that do not render are final
+                smoke_failures = {}
+                if SMOKE_CHECKS:
+                    slot = await browser_pool.acquire()
+                    try:
+                        plans, borrowed = _smoke_plans(test_cases)
+                        plans = [plan if i in run_indices else [] for i, plan in enumerate(plans)]
+                        smoke_failures = await smoke.run(plans, [f"http://localhost:{port}" for port in ports], slot.endpoint)
+                        # Matching by position can pair a criterion with another requirement's routes; never final then
+                        for test_index in borrowed & smoke_failures.keys():
+                            smoke_failures[test_index]["final"] = False
+                    except Exception as e:
+                        print(f"Smoke checks skipped: {str(e)}")
+                    finally:
+                        browser_pool.release(slot)
+                for test_index, failure in smoke_failures.items():
+                    if not failure["final"]:
+                        print(f"Test {test_index + 1} smoke evidence, left to the agent: {failure['evidence']}")
+                        continue
+                    failed_tests += 1
+                    completed_tests += 1
+                    results_by_index[test_index] = f"Test {test_index + 1}: Failure - {failure['evidence']}"
+                agent_execution_status.update({
+                    "completed_tests": completed_tests,
+                    "failed_tests": failed_tests,
+                    "current_results": [r for r in results_by_index if r]
+                })
 
-                
-                while current_test_index < total_test_count:
-                    round_number += 1
-                    agent_execution_status['current_round'] = round_number
-                    
-                    remaining_tests = total_test_count - current_test_index
-                    current_round_tests = min(PARALLEL_AGENT_COUNT, remaining_tests)
-                    
-                    print(f"\n=== {round_number} round started ===")
-                    print(f"Running test cases: {current_round_tests}")
-                    print(f"Remaining test cases: {remaining_tests}")
-                    
-                    round_tasks = []
-                    round_urls = []
-                    
-                    for i in range(current_round_tests):
-                        test_index = current_test_index + i
-                        test_criteria = test_array[test_index]
-                        target_url = f"http://localhost:{ports[i % len(ports)]}"
-                        
-                        round_tasks.append(test_criteria)
-                        round_urls.append(target_url)
-                        
+                # Tier 2, work queue: one worker per pm2 instance, each pulls the next test as soon as it is free
+                queue = asyncio.Queue()
+                if _fail_fast_reached(failed_tests, total_test_count):
+                    agent_execution_status["stopped_early"] = True
+                    print(f"Fail-fast: {failed_tests} failed of {total_test_count} before any agent started")
+                else:
+                    for test_index in run_indices:
+                        if not smoke_failures.get(test_index, {}).get("final"):
+                            queue.put_nowait(test_index)
+                worker_tasks = []
+
+                def stop_early():
+                    # Cancelled agents unwind through run_single_agent's finally, which resets and releases their browser
+                    agent_execution_status["stopped_early"] = True
+                    print(f"Fail-fast: {failed_tests} failed of {total_test_count}, cancelling the remaining tests")
+                    for task in worker_tasks:
+                        if task is not asyncio.current_task():
+                            task.cancel()
+
+                async def worker(worker_id: int, target_url: str):
+                    nonlocal completed_tests, successful_tests, failed_tests
+                    while True:
+                        try:
+                            test_index = queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            return
                         print(f"Test cases {test_index + 1} -> {target_url}")
-                    
-                    tasks = []
-                    for i in range(current_round_tests):
-                        task = run_single_agent(i+1, round_tasks[i], round_urls[i])
-                        tasks.append(task)
-                    
-                    print(f"Paralleling {len(tasks)} test cases...")
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-                    
-                    round_success = 0
-                    round_errors = 0
-                    
-                    for i, result in enumerate(results):
-                        test_index = current_test_index + i
+                        try:
+                            result = await run_single_agent(worker_id, test_array[test_index], target_url, log_name=f"test_{test_index + 1}")
+                        except Exception as e:
+                            result = e
+
                         if isinstance(result, Exception):
-                            round_errors += 1
                             failed_tests += 1
                             result_str = f"Test {test_index + 1}: Error - {str(result)}"
+                        elif result == "Success":
+                            successful_tests += 1
+                            result_str = ""
                         else:
-                            if result == "Success":
-                                round_success += 1
-                                successful_tests += 1
-                                result_str = ""
-                            else:
-                                failed_tests += 1
-                                result_str = f"Test {test_index + 1}: Failure - {result}"
-                        
-                        all_results.append(result_str)
+                            failed_tests += 1
+                            result_str = f"Test {test_index + 1}: Failure - {result}"
+                        if result_str and test_index in smoke_failures:
+                            result_str += f" ({smoke_failures[test_index]['evidence']})"
+                        results_by_index[test_index] = result_str
                         completed_tests += 1
-                    
-                    agent_execution_status.update({
-                        "completed_tests": completed_tests,
-                        "successful_tests": successful_tests,
-                        "failed_tests": failed_tests,
-                        "current_results": all_results[-current_round_tests:]
-                    })
-                    
-                    print(f"{round_number} rounds completed, {round_success} success, {round_errors} fail")
-                    print(f"Completed/Total: {completed_tests}/{total_test_count}")
-                    
-                    current_test_index += current_round_tests
-                
+
+                        agent_execution_status.update({
+                            "completed_tests": completed_tests,
+                            "successful_tests": successful_tests,
+                            "failed_tests": failed_tests,
+                            "current_results": [r for r in results_by_index if r]
+                        })
+                        print(f"Completed/Total: {completed_tests}/{total_test_count}")
+                        if result_str and _fail_fast_reached(failed_tests, total_test_count):
+                            stop_early()
+                            return
+
+                worker_tasks.extend(
+                    asyncio.create_task(worker(i + 1, f"http://localhost:{ports[i % len(ports)]}"))
+                    for i in range(min(PARALLEL_AGENT_COUNT, queue.qsize()))
+                )
+                print(f"Running {queue.qsize()} test cases on {len(worker_tasks)} workers...")
+                await asyncio.gather(*worker_tasks, return_exceptions=True)
+                all_results = [
+                    f"Test {i + 1}: Not run (validation stopped after {failed_tests} failures)" if result is None else result
+                    for i, result in enumerate(results_by_index)
+                ]
+                await _update_impact_index(results_by_index)
+
                 agent_execution_status.update({
                     "is_running": False,
                     "end_time": time.time()
@@ -1034,13 +1625,14 @@ def valiv2():
                         print(f"Error saving the result {str(e)}")
 
                     update_csv_results(vali_run_counter, file_name, successful_tests, failed_tests)
-                    
-                    return all_results
+
+                    # The feedback lists only real failures: successes are empty and "Not run" tests were never checked
+                    return [result for result in results_by_index if result]
 
             try:
                 global vali_run_counter, round_limit
                 result = asyncio.run(run_test_rounds())
-                stop_all_webapps_pm2()
+                finish_round_webapps()
 
 
                 if result == "Success":
@@ -1052,7 +1644,7 @@ def valiv2():
                         feedback_prompt = get_prompt("TESTING_FEEDBACK", reports=str(result))
                     return jsonify({"message": "continue", "result": str(feedback_prompt), "model": model, "provider": provider})
             except Exception as e:
-                stop_all_webapps_pm2()
+                finish_round_webapps()
                 error_prompt = get_prompt("LAUNCHING_FAILED", errors=str(e))
                 return jsonify({"message": "error", "result": str(error_prompt)})
 
@@ -1210,4 +1802,5 @@ def valiv1():
         return jsonify({"message": "error", "result": f"ERROR: {str(e)}"})
 
 if __name__ == '__main__':
+    delete_orphaned_webapps()
     app.run(debug=True)
\ No newline at end of file
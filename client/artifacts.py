@@ -0,0 +1,42 @@
+"""Wait for the bolt export zip to be fully written before validating it."""
+import os
+import time
+import zipfile
+from pathlib import Path
+
+ARTIFACT_TIMEOUT = int(os.environ.get("ARTIFACT_TIMEOUT", "120"))
+
+
+def _is_complete_zip(path: Path) -> bool:
+    # The central directory is written last, so a readable one means the archive is complete
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            return bool(zf.namelist())
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+
+def wait_for_artifact(path, timeout: float = ARTIFACT_TIMEOUT, stable_for: float = 0.5, poll: float = 0.1) -> bool:
+    """Return True as soon as `path` exists, its size has not changed for `stable_for`
+    seconds and it opens as a valid zip; False if that does not happen within `timeout`."""
+    path = Path(path)
+    started = time.time()
+    last_size = None
+    stable_since = None
+    while time.time() - started < timeout:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = None
+        if size is not None and size == last_size:
+            if stable_since is None:
+                stable_since = time.time()
+            if time.time() - stable_since >= stable_for and _is_complete_zip(path):
+                print(f"Artifact {path.name} ready after {time.time() - started:.1f}s ({size} bytes)")
+                return True
+        else:
+            stable_since = None
+        last_size = size
+        time.sleep(poll)
+    print(f"Artifact {path.name} not ready after {timeout}s")
+    return False
@@ -1,100 +1,325 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import threading
 import time
-from tqdm import tqdm
+import httpx
+from llm_cache import response_cache, make_key, CACHE_ENABLED
+from prompts import PROMPT_TEMPLATE_VERSION
+from retry import default_policy, EmptyCompletionError
+from json_stream import JsonStreamValidator, MalformedStreamError
+
+# One keep-alive connection pool per (key, base_url), shared by every bot instance
+_POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60)
+_sync_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _completion_text(response):
+    if not response.choices or response.choices[0].message.content is None:
+        raise EmptyCompletionError("completion has no content")
+    return response.choices[0].message.content
+
+
+def get_shared_client(key, base_url=None):
+    with _clients_lock:
+        client = _sync_clients.get((key, base_url))
+        if client is None:
+            # Retries are driven by retry.RetryPolicy, not the SDK
+            kwargs = {"api_key": key, "max_retries": 0, "http_client": httpx.Client(limits=_POOL_LIMITS)}
+            if base_url:
+                kwargs["base_url"] = base_url
+            client = OpenAI(**kwargs)
+            _sync_clients[(key, base_url)] = client
+        return client
+
+
+def get_shared_async_client(key, base_url=None):
+    # httpx.AsyncClient is bound to the event loop it was first used on, and every
+    # asyncio.run() in app.py starts a fresh loop, so async clients are pooled per loop
+    # and closed by run_async when their loop ends.
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        for stale in [k for k in _async_clients if k[2].is_closed()]:
+            # Loop ended without run_async; its sockets are released when the client is collected
+            del _async_clients[stale]
+        client = _async_clients.get((key, base_url, loop))
+        if client is None:
+            kwargs = {"api_key": key, "max_retries": 0, "http_client": httpx.AsyncClient(limits=_POOL_LIMITS)}
+            if base_url:
+                kwargs["base_url"] = base_url
+            client = AsyncOpenAI(**kwargs)
+            _async_clients[(key, base_url, loop)] = client
+        return client
+
+
+async def close_async_clients():
+    """Close the shared async clients bound to the running loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = [_async_clients.pop(k) for k in list(_async_clients) if k[2] is loop]
+    for client in clients:
+        await client.close()
+
+
+def run_async(coro):
+    """asyncio.run() that closes the loop's shared async clients before the loop goes away."""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_async_clients()
+    return asyncio.run(runner())
+
+
+# Leading base64 characters of each image format's magic bytes
+_IMAGE_SIGNATURES = (("iVBOR", "image/png"), ("/9j/", "image/jpeg"), ("UklGR", "image/webp"), ("R0lGOD", "image/gif"))
+
+
+def _data_url(image_encoding):
+    if image_encoding.startswith("data:"):
+        return image_encoding
+    mime = next((m for prefix, m in _IMAGE_SIGNATURES if image_encoding.startswith(prefix)), "image/png")
+    return f"data:{mime};base64,{image_encoding}"
+
+
+def build_message(question, image_encoding=None, image_encoding2=None):
+    if image_encoding:
+        if image_encoding2:
+            print("2 images")
+            return {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": question},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": _data_url(image_encoding),
+                        },
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": _data_url(image_encoding2),
+                        },
+                    },
+                ],
+            }
+        print("1 image")
+        return {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": _data_url(image_encoding),
+                    },
+                },
+            ],
+        }
+    print("text only")
+    return {"role": "user", "content": question}
+
+
+def clean_response(response):
+    response_clean = response.strip()
+    if response_clean.startswith('```json'):
+        response_clean = response_clean[len('```json'):].strip()
+    if response_clean.endswith('```'):
+        response_clean = response_clean[:-3].strip()
+    return response_clean
+
+
+def _print_error(e):
+    print("\n\n\n")
+    print(f"⚠️⚠️⚠️openai error: {e}")
+    print(f"⛔️⛔️⛔️type: {type(e).__name__}")
+    print(f"🚨🚨🚨details: {str(e)}")
+
+
+def _print_verbose(question, response):
+    print("####################################")
+    print("question:\n", question)
+    print("####################################")
+    print("response:\n", response)
+    print("\n\n\n\n\n\n\n")
+
 
 class Bot:
     def __init__(self, key, patience=1) -> None:
         self.key = key
         self.patience = patience
-    
+
     def ask(self):
         raise NotImplementedError
 
 
 class OpenAILLM(Bot):
-    def __init__(self, key, base_url=None, patience=1, model="gpt-4.1") -> None:
+    def __init__(self, key, base_url=None, patience=1, model="gpt-4.1", retry_policy=None) -> None:
         super().__init__(key, patience)
-        if base_url:
-            self.client = OpenAI(
-                api_key=self.key,
-                base_url=base_url
+        self.base_url = base_url
+        self.client = get_shared_client(self.key, base_url)
+        self.model = model
+        self.retry_policy = retry_policy or default_policy
+        self.last_ttft = None
+        self.last_latency = None
+
+    def cache_key(self, question, image_encoding=None, image_encoding2=None):
+        return make_key(self.model, self.base_url, question, (image_encoding, image_encoding2), PROMPT_TEMPLATE_VERSION)
+
+    def _create(self, content, timeout=None):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                content
+            ],
+            timeout=timeout,
+        )
+        return _completion_text(response)
+
+    def _query(self, content):
+        return self.retry_policy.call(lambda timeout: self._create(content, timeout), on_error=_print_error)
+
+    def ask(self, question, image_encoding=None, image_encoding2=None, verbose=False, use_cache=True):
+        """Query the model. `use_cache=False` skips the cache lookup (e.g. re-asking after a bad output)
+        but still stores the fresh response."""
+        print(f"Querying {self.model}, please wait...")
+        content = build_message(question, image_encoding, image_encoding2)
+        if CACHE_ENABLED:
+            response, hit = response_cache.get_or_compute(
+                self.cache_key(question, image_encoding, image_encoding2),
+                lambda: self._query(content),
+                use_cache=use_cache,
+                meta={"model": self.model, "base_url": self.base_url},
+            )
+            if hit:
+                print(f"Cache hit for {self.model}")
+        else:
+            response = self._query(content)
+        if verbose:
+            _print_verbose(question, response)
+
+        return clean_response(response)
+
+    def _stream(self, content, expect, lenient=False, timeout=None):
+        started = time.monotonic()
+        self.last_ttft = None
+        validator = JsonStreamValidator(expect, lenient=lenient) if expect else None
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                content
+            ],
+            stream=True,
+            timeout=timeout,
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if self.last_ttft is None:
+                    self.last_ttft = time.monotonic() - started
+                # The request timeout bounds each read, not the whole stream
+                if timeout is not None and time.monotonic() - started > timeout:
+                    raise TimeoutError(f"stream exceeded the {timeout:.0f}s call deadline")
+                parts.append(delta)
+                if validator:
+                    validator.feed(delta)
+            if not parts:
+                raise EmptyCompletionError("stream ended without any content")
+            if validator:
+                validator.close()
+        except MalformedStreamError as e:
+            print(f"Aborting malformed stream after {len(e.partial)} chars: {e}")
+            raise
+        finally:
+            stream.close()
+            self.last_latency = time.monotonic() - started
+        return "".join(parts)
+
+    def ask_stream(self, question, image_encoding=None, image_encoding2=None, verbose=False, use_cache=True, expect="array", lenient=False):
+        """Streaming variant of `ask` that validates the JSON incrementally.
+
+        Raises MalformedStreamError as soon as the output can no longer be valid JSON of the
+        `expect`ed kind ("array", "object", "any" or None to disable); `lenient` only aborts on
+        defects json_repair cannot fix. Time to first token and
+        total latency of the call are left in `last_ttft` / `last_latency` (both 0 on a cache hit).
+        """
+        print(f"Streaming {self.model}, please wait...")
+        content = build_message(question, image_encoding, image_encoding2)
+        compute = lambda: self.retry_policy.call(lambda timeout: self._stream(content, expect, lenient, timeout), on_error=_print_error)
+        if CACHE_ENABLED:
+            response, hit = response_cache.get_or_compute(
+                self.cache_key(question, image_encoding, image_encoding2),
+                compute,
+                use_cache=use_cache,
+                meta={"model": self.model, "base_url": self.base_url},
             )
+            if hit:
+                print(f"Cache hit for {self.model}")
+                self.last_ttft = self.last_latency = 0.0
         else:
-            self.client = OpenAI(api_key=self.key)
+            response = compute()
+        if verbose:
+            _print_verbose(question, response)
+        if self.last_ttft is not None:
+            print(f"{self.model} TTFT: {self.last_ttft:.2f}s, total: {self.last_latency:.2f}s")
+
+        return clean_response(response)
+
+
+class AsyncOpenAILLM(Bot):
+    """Awaitable counterpart of OpenAILLM with the same `ask` contract.
+
+    Requests go through a keep-alive pool shared per (key, base_url) and event loop, so several
+    `ask` calls can be gathered concurrently without paying connection setup each time.
+    """
+    def __init__(self, key, base_url=None, patience=1, model="gpt-4.1", retry_policy=None) -> None:
+        super().__init__(key, patience)
+        self.base_url = base_url
         self.model = model
-        
-    def ask(self, question, image_encoding=None, image_encoding2=None, verbose=False):
-        print(f"Querying {self.model}, please wait...")
-        
-        if image_encoding:
-            if image_encoding2:
-                print("2 images")
-                content = {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": question},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_encoding}",
-                            },
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_encoding2}",
-                            },
-                        },
-                    ],
-                }
-            else:
-                print("1 image")
-                content = {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": question},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_encoding}",
-                            },
-                        },
-                    ],
-                }
+        self.retry_policy = retry_policy or default_policy
+
+    @property
+    def client(self):
+        return get_shared_async_client(self.key, self.base_url)
+
+    def cache_key(self, question, image_encoding=None, image_encoding2=None):
+        return make_key(self.model, self.base_url, question, (image_encoding, image_encoding2), PROMPT_TEMPLATE_VERSION)
+
+    async def _create(self, content, timeout=None):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                content
+            ],
+            timeout=timeout,
+        )
+        return _completion_text(response)
 
+    async def _query(self, content):
+        return await self.retry_policy.acall(lambda timeout: self._create(content, timeout), on_error=_print_error)
 
+    async def ask(self, question, image_encoding=None, image_encoding2=None, verbose=False, use_cache=True):
+        print(f"Querying {self.model}, please wait...")
+        content = build_message(question, image_encoding, image_encoding2)
+        if CACHE_ENABLED:
+            response, hit = await response_cache.aget_or_compute(
+                self.cache_key(question, image_encoding, image_encoding2),
+                lambda: self._query(content),
+                use_cache=use_cache,
+                meta={"model": self.model, "base_url": self.base_url},
+            )
+            if hit:
+                print(f"Cache hit for {self.model}")
         else:
-            print("text only")
-            content = {"role": "user", "content": question}
-        while True:
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        content
-                    ],
-                )
-                response = response.choices[0].message.content
-                break
-            except Exception as e:
-                print("\n\n\n")
-                print(f"⚠️⚠️⚠️openai error: {e}")
-                print(f"⛔️⛔️⛔️type: {type(e).__name__}")
-                print(f"🚨🚨🚨details: {str(e)}")
-                print("⏰⏰⏰ Pending...Try to fix it! 🧰🧰🧰")
-                for _ in tqdm(range(60), desc="Retry after:"):
-                    time.sleep(1)
+            response = await self._query(content)
         if verbose:
-            print("####################################")
-            print("question:\n", question)
-            print("####################################")
-            print("response:\n", response)
-            print("\n\n\n\n\n\n\n")
-
-        response_clean = response.strip()
-        if response_clean.startswith('```json'):
-            response_clean = response_clean[len('```json'):].strip()
-        if response_clean.endswith('```'):
-            response_clean = response_clean[:-3].strip()
-
-        return response_clean
\ No newline at end of file
+            _print_verbose(question, response)
+
+        return clean_response(response)
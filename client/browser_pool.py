@@ -0,0 +1,207 @@
+"""Pool of long-lived Chrome processes shared by the browser-use agents and the
+Playwright test tiers (replays, compiled tests, smoke checks, footprint crawls).
+
+Each slot is one Chrome started with its own profile directory and a remote
+debugging port. Callers connect to a leased slot over CDP instead of cold-starting
+a browser per test; on return the slot is reset (extra tabs closed, cookies and
+site storage cleared) so the next lease starts from a clean, isolated state.
+Crashed or unresponsive browsers are detected by a health check and relaunched.
+"""
+import asyncio
+import atexit
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from browser_use import BrowserSession
+
+CHROME_PATH = os.environ.get("CHROME_PATH", "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")
+BROWSER_HEADLESS = os.environ.get("BROWSER_HEADLESS", "0") == "1"
+LAUNCH_TIMEOUT = 30
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BrowserSlot:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.port = None
+        self.process = None
+        self.profile_dir = None
+        self.in_use = False
+        self.launches = 0
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def launch(self):
+        self.shutdown()
+        self.port = _free_port()
+        self.profile_dir = tempfile.mkdtemp(prefix=f"tddev-browser-{self.index}-")
+        args = [
+            CHROME_PATH,
+            f"--remote-debugging-port={self.port}",
+            f"--user-data-dir={self.profile_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-background-timer-throttling",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-renderer-backgrounding",
+        ]
+        if BROWSER_HEADLESS:
+            args.append("--headless=new")
+        args.append("about:blank")
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.launches += 1
+        deadline = time.time() + LAUNCH_TIMEOUT
+        while time.time() < deadline:
+            if self.healthy():
+                print(f"Browser {self.index} ready on port {self.port}")
+                return
+            time.sleep(0.2)
+        self.shutdown()
+        raise RuntimeError(f"Browser {self.index} did not expose CDP on port {self.port} within {LAUNCH_TIMEOUT}s")
+
+    def healthy(self) -> bool:
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            return requests.get(f"{self.endpoint}/json/version", timeout=2).ok
+        except requests.exceptions.RequestException:
+            return False
+
+    def cdp_url(self) -> str:
+        return requests.get(f"{self.endpoint}/json/version", timeout=2).json()["webSocketDebuggerUrl"]
+
+    def close_extra_tabs(self):
+        """Leave exactly one blank tab open."""
+        try:
+            requests.put(f"{self.endpoint}/json/new?about:blank", timeout=5)
+            pages = [t for t in requests.get(f"{self.endpoint}/json/list", timeout=5).json() if t.get("type") == "page"]
+        except requests.exceptions.RequestException:
+            return
+        keep = next((t["id"] for t in reversed(pages) if t.get("url") == "about:blank"), None)
+        for target in pages:
+            if target["id"] != keep:
+                try:
+                    requests.get(f"{self.endpoint}/json/close/{target['id']}", timeout=5)
+                except requests.exceptions.RequestException:
+                    pass
+
+    def shutdown(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+
+class BrowserPool:
+    """Thread-safe pool; usable from the sync Flask handlers and from any asyncio loop."""
+    def __init__(self, size: int = 1) -> None:
+        self.size = size
+        self._slots: list[BrowserSlot] = []
+        self._lock = threading.Lock()
+        self.recycled = 0
+
+    def resize(self, size: int):
+        with self._lock:
+            self.size = size
+            while len(self._slots) > size and not self._slots[-1].in_use:
+                self._slots.pop().shutdown()
+
+    def _try_acquire(self) -> BrowserSlot | None:
+        with self._lock:
+            slot = next((s for s in self._slots if not s.in_use), None)
+            if slot is None and len(self._slots) < self.size:
+                slot = BrowserSlot(len(self._slots))
+                self._slots.append(slot)
+            if slot is not None:
+                slot.in_use = True
+            return slot
+
+    def _prepare(self, slot: BrowserSlot) -> BrowserSlot:
+        try:
+            if not slot.healthy():
+                if slot.process is not None:
+                    print(f"Browser {slot.index} unhealthy, recycling")
+                    self.recycled += 1
+                slot.launch()
+        except Exception:
+            self.release(slot)
+            raise
+        return slot
+
+    async def acquire(self, poll: float = 0.1) -> BrowserSlot:
+        while True:
+            slot = self._try_acquire()
+            if slot is not None:
+                return await asyncio.to_thread(self._prepare, slot)
+            await asyncio.sleep(poll)
+
+    def release(self, slot: BrowserSlot):
+        with self._lock:
+            slot.in_use = False
+            if slot not in self._slots[:self.size]:
+                if slot in self._slots:
+                    self._slots.remove(slot)
+                slot.shutdown()
+
+    async def new_session(self, slot: BrowserSlot) -> BrowserSession:
+        """A browser-use session attached to the slot's browser; closing it leaves the browser running."""
+        cdp_url = await asyncio.to_thread(slot.cdp_url)
+        return BrowserSession(cdp_url=cdp_url, keep_alive=True)
+
+    async def reset(self, slot: BrowserSlot, session: BrowserSession | None, urls=()):
+        """Clear cookies and site storage for the visited origins, close extra tabs, detach the session."""
+        if session is not None:
+            try:
+                await session.cdp_client.send.Network.clearBrowserCookies()
+                for url in urls:
+                    parsed = urlparse(url)
+                    await session.cdp_client.send.Storage.clearDataForOrigin(
+                        params={"origin": f"{parsed.scheme}://{parsed.netloc}", "storageTypes": "all"}
+                    )
+            except Exception as e:
+                print(f"Browser {slot.index} reset failed: {e}")
+            try:
+                await session.stop()
+            except Exception:
+                pass
+        await asyncio.to_thread(slot.close_extra_tabs)
+
+    def shutdown(self):
+        with self._lock:
+            for slot in self._slots:
+                slot.shutdown()
+            self._slots = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "running": sum(1 for s in self._slots if s.process is not None and s.process.poll() is None),
+                "in_use": sum(1 for s in self._slots if s.in_use),
+                "launches": sum(s.launches for s in self._slots),
+                "recycled": self.recycled,
+            }
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
@@ -0,0 +1,227 @@
+"""Compile-time gate run after install and before any instance or agent starts.
+
+The project's type checker and bundler build run concurrently in one shot;
+their errors are parsed into structured diagnostics that go straight into
+LOADING_FAILED feedback, so a TypeScript or import error ends the round in
+seconds without a dev server, browser or vision-model call.
+
+COMPILE_GATE selects what runs: "build" (vite build only, the default: the dev
+server tolerates type errors, so they should not fail a round), "full"
+(tsc --noEmit + vite build) or "0" (off). Rounds that keep their dev servers
+running skip the build: check_dev_server asks the running server to transform
+just the files that changed, which is what HMR is about to do anyway.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from static_serve import build_command
+
+COMPILE_GATE = os.environ.get("COMPILE_GATE", "build")
+COMPILE_GATE_TIMEOUT = int(os.environ.get("COMPILE_GATE_TIMEOUT", "300"))
+MAX_DIAGNOSTICS = 30
+
+_ANSI = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+_TSC_ERROR = re.compile(r"^(?P<file>[^\s(][^(]*)\((?P<line>\d+),(?P<column>\d+)\): error (?P<code>TS\d+): (?P<message>.*)$")
+_VITE_MODULES = re.compile(r"\.(?:[cm]?[jt]sx?|vue|svelte|css|scss|sass|less)$")
+_VITE_ERROR_MESSAGE = re.compile(r'"message"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_ESBUILD_ERROR = re.compile(r"^(?:✘ \[ERROR\] )?(?P<file>[^\s:][^:]*):(?P<line>\d+):(?P<column>\d+): (?:ERROR|error): (?P<message>.*)$")
+
+
+class CompileError(RuntimeError):
+    def __init__(self, diagnostics: list[dict]) -> None:
+        self.diagnostics = diagnostics
+        super().__init__(format_diagnostics(diagnostics))
+
+
+def format_diagnostics(diagnostics: list[dict]) -> str:
+    lines = [f"The project failed to compile ({len(diagnostics)} error(s)):"]
+    for d in diagnostics[:MAX_DIAGNOSTICS]:
+        location = d["file"] or ""
+        if d["line"]:
+            location += f":{d['line']}:{d['column']}"
+        if d["code"]:
+            location += f" {d['code']}"
+        lines.append(f"- [{d['tool']}] {location + ': ' if location else ''}{d['message']}")
+    if len(diagnostics) > MAX_DIAGNOSTICS:
+        lines.append(f"... and {len(diagnostics) - MAX_DIAGNOSTICS} more")
+    return "\n".join(lines)
+
+
+def _diagnostic(tool, message, file=None, line=None, column=None, code=None) -> dict:
+    return {"tool": tool, "file": file, "line": line, "column": column, "code": code, "message": message.strip()}
+
+
+def _relative(app_dir: Path, file: str) -> str:
+    try:
+        return str(Path(file).resolve().relative_to(app_dir.resolve()))
+    except ValueError:
+        return file
+
+
+def parse_tsc(output: str, app_dir: Path) -> list[dict]:
+    diagnostics = []
+    for raw in _ANSI.sub("", output).splitlines():
+        match = _TSC_ERROR.match(raw)
+        if match:
+            diagnostics.append(_diagnostic(
+                "tsc", match["message"], _relative(app_dir, match["file"]),
+                int(match["line"]), int(match["column"]), match["code"],
+            ))
+        elif diagnostics and raw.startswith("  "):
+            # Continuation of the previous message (e.g. "Type 'x' is not assignable ...")
+            diagnostics[-1]["message"] += " " + raw.strip()
+    return diagnostics
+
+
+def parse_vite(output: str, app_dir: Path) -> list[dict]:
+    text = _ANSI.sub("", output)
+    diagnostics = []
+    for raw in text.splitlines():
+        match = _ESBUILD_ERROR.match(raw.strip())
+        if match:
+            diagnostics.append(_diagnostic(
+                "vite", match["message"], _relative(app_dir, match["file"]),
+                int(match["line"]), int(match["column"]),
+            ))
+    if diagnostics:
+        return diagnostics
+    # Rollup/plugin errors: keep the block after "error during build:"
+    _, marker, rest = text.partition("error during build:")
+    block = rest if marker else text[-2000:]
+    message = "\n".join(line for line in block.strip().splitlines()[:15] if not line.strip().startswith("at "))
+    return [_diagnostic("vite", message or "vite build failed without output")]
+
+
+def _typecheck_command(app_dir: Path) -> list[str] | None:
+    tsconfig = app_dir / "tsconfig.json"
+    if not tsconfig.is_file() or not (app_dir / "node_modules" / "typescript").is_dir():
+        return None
+    try:
+        # tsconfig allows comments and trailing commas; only the presence of references matters here
+        has_references = '"references"' in tsconfig.read_text(encoding="utf-8")
+    except OSError:
+        has_references = False
+    if has_references:
+        # --noEmit keeps build mode from writing .js/.d.ts/.tsbuildinfo into the workspace
+        return ["npx", "--no-install", "tsc", "-b", "--noEmit", "--pretty", "false"]
+    return ["npx", "--no-install", "tsc", "--noEmit", "--pretty", "false", "-p", "tsconfig.json"]
+
+
+def _uses_vite(app_dir: Path) -> bool:
+    try:
+        with open(app_dir / "package.json", "r", encoding="utf-8") as f:
+            package = json.load(f)
+    except Exception:
+        return False
+    return "vite" in {**package.get("dependencies", {}), **package.get("devDependencies", {})}
+
+
+def _communicate(process, deadline) -> tuple[str, bool]:
+    """(output, timed_out) of `process`, killed once `deadline` passes."""
+    try:
+        output, _ = process.communicate(timeout=max(1, deadline - time.time()))
+        return output, False
+    except subprocess.TimeoutExpired:
+        process.kill()
+        output, _ = process.communicate()
+        return output, True
+
+
+def run(app_dir, out_dir=None, mode: str | None = None, timeout: int = COMPILE_GATE_TIMEOUT) -> dict:
+    """Type-check and build app_dir; raises CompileError with the diagnostics on failure.
+
+    The build goes to `out_dir` (kept, e.g. for static serving) or to a throwaway
+    directory outside the project so running dev servers do not see it."""
+    app_dir = Path(app_dir)
+    mode = mode or COMPILE_GATE
+    report = {"mode": mode, "typecheck": None, "build": None, "seconds": 0.0}
+    if mode in ("0", "off"):
+        return report
+
+    started = time.time()
+    scratch = None
+    jobs = {}
+    if mode == "full":
+        command = _typecheck_command(app_dir)
+        if command:
+            jobs["typecheck"] = command
+    if _uses_vite(app_dir):
+        if out_dir is None:
+            scratch = tempfile.mkdtemp(prefix="tddev-build-")
+        jobs["build"] = build_command(out_dir or scratch, sourcemap=out_dir is not None)
+    try:
+        processes = {
+            name: subprocess.Popen(command, cwd=str(app_dir), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            for name, command in jobs.items()
+        }
+        # Drain every pipe at once: a full pipe would stall one tool while we wait on the other
+        with ThreadPoolExecutor(max_workers=max(1, len(processes))) as pool:
+            outputs = dict(zip(processes, pool.map(lambda process: _communicate(process, started + timeout), processes.values())))
+        diagnostics = []
+        for name, process in processes.items():
+            output, timed_out = outputs[name]
+            if timed_out:
+                diagnostics.append(_diagnostic(name, f"{' '.join(jobs[name][2:])} did not finish within {timeout}s"))
+                report[name] = "timeout"
+                continue
+            report[name] = "ok" if process.returncode == 0 else "failed"
+            if process.returncode != 0:
+                parser = parse_tsc if name == "typecheck" else parse_vite
+                diagnostics += parser(output, app_dir) or [_diagnostic(name, output[-2000:])]
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+    report["seconds"] = round(time.time() - started, 1)
+    print(f"Compile gate: typecheck={report['typecheck']} build={report['build']} in {report['seconds']}s")
+    if diagnostics:
+        raise CompileError(diagnostics)
+    return report
+
+
+def _transform_error(url: str, timeout: float) -> str | None:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout):
+            return None
+    except urllib.error.HTTPError as e:
+        if e.code != 500:
+            return None
+        body = e.read().decode("utf-8", "replace")
+    except (OSError, ValueError) as e:
+        return f"request failed: {e}"
+    # Vite answers a failed transform with its error overlay page, which embeds the error as JSON
+    match = _VITE_ERROR_MESSAGE.search(body)
+    if not match:
+        return _ANSI.sub("", body).strip()[:500] or "transform failed"
+    try:
+        return json.loads(f'"{match[1]}"')
+    except ValueError:
+        return match[1]
+
+
+def check_dev_server(port: int, changed: list[str], mode: str | None = None, timeout: int = COMPILE_GATE_TIMEOUT) -> dict:
+    """Have the dev server on `port` transform the changed modules; raises CompileError on failure."""
+    mode = mode or COMPILE_GATE
+    report = {"mode": mode, "typecheck": None, "build": None, "seconds": 0.0}
+    # public/ is served as-is from the site root and never transformed
+    modules = [name for name in changed if _VITE_MODULES.search(name) and not name.startswith("public/")]
+    if mode in ("0", "off") or not modules:
+        return report
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=min(8, len(modules))) as pool:
+        errors = list(pool.map(lambda name: _transform_error(f"http://localhost:{port}/{name}", timeout), modules))
+    diagnostics = [_diagnostic("vite", error, name) for name, error in zip(modules, errors) if error]
+    report["build"] = "failed" if diagnostics else "ok"
+    report["seconds"] = round(time.time() - started, 1)
+    print(f"Compile gate: {len(modules)} changed module(s) transformed by the dev server: build={report['build']} in {report['seconds']}s")
+    if diagnostics:
+        raise CompileError(diagnostics)
+    return report
@@ -0,0 +1,195 @@
+"""Test criteria compiled into executable Playwright steps.
+
+Once per job, each natural-language criterion is translated by one LLM call
+(COMPILE_TEST prompt) into a declarative list of actions and assertions that
+locate elements by role, label, placeholder, text or test id. The result is
+cached on disk by criterion hash. Every round the steps run natively against
+a pooled browser in seconds; a compiled test that cannot locate an element or
+whose assertion fails hands the criterion to the browser-use agent, since it
+was written without seeing the page. A test can only pass if it checks what the
+criterion expects: it must assert at least once per narrative step and end on
+an assertion, otherwise it is stored as not compilable.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+from playwright.async_api import async_playwright, expect
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from replay import criterion_key
+
+COMPILED_TESTS_DIR = Path(os.environ.get("COMPILED_TESTS_DIR", str(Path(__file__).resolve().parent / "cache" / "compiled_tests")))
+COMPILE_TESTS = os.environ.get("COMPILE_TESTS", "1") != "0"
+COMPILE_CONCURRENCY = int(os.environ.get("COMPILE_TESTS_CONCURRENCY", "5"))
+STEP_TIMEOUT_MS = 5000
+ASSERTION_OPS = ("expect_visible", "expect_hidden", "expect_text", "expect_value", "expect_count", "expect_url")
+
+stats = {"runs": 0, "passed": 0, "unlocatable": 0, "assertion_failed": 0}
+_lock = threading.Lock()
+
+
+class CompiledTestFailure(Exception):
+    def __init__(self, message: str, unlocatable: bool = False) -> None:
+        super().__init__(message)
+        self.unlocatable = unlocatable
+
+
+class CompiledTestStore:
+    def __init__(self, directory: Path = COMPILED_TESTS_DIR) -> None:
+        self.directory = Path(directory)
+
+    def _path(self, criterion: str) -> Path:
+        return self.directory / f"{criterion_key(criterion)}.json"
+
+    def get(self, criterion: str) -> dict | None:
+        try:
+            with open(self._path(criterion), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, criterion: str, test: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(criterion).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**test, "criterion": criterion}, f, indent=2)
+        os.replace(tmp, self._path(criterion))
+
+
+def missing_assertions(test: dict, criterion: str) -> str | None:
+    """Why `test` cannot show that `criterion` holds, or None if it asserts enough to."""
+    steps = test.get("steps") or []
+    assertions = sum(step["op"] in ASSERTION_OPS for step in steps)
+    try:
+        narrative = json.loads(criterion).get("narrative_steps") or []
+    except (ValueError, AttributeError):
+        narrative = []
+    if not assertions:
+        return "no expect_* step"
+    if assertions < len(narrative):
+        return f"{assertions} assertion(s) for {len(narrative)} narrative step(s)"
+    if steps[-1]["op"] not in ASSERTION_OPS:
+        return f"last step ({steps[-1]['op']}) is not checked"
+    return None
+
+
+def _locator(page, target: dict):
+    exact = bool(target.get("exact", False))
+    if "role" in target:
+        locator = page.get_by_role(target["role"], name=target["name"], exact=exact) if target.get("name") else page.get_by_role(target["role"])
+    elif "label" in target:
+        locator = page.get_by_label(target["label"], exact=exact)
+    elif "placeholder" in target:
+        locator = page.get_by_placeholder(target["placeholder"], exact=exact)
+    elif "text" in target:
+        locator = page.get_by_text(target["text"], exact=exact)
+    elif "test_id" in target:
+        locator = page.get_by_test_id(target["test_id"])
+    else:
+        raise CompiledTestFailure(f"unsupported target {json.dumps(target)}")
+    return locator.nth(int(target["nth"])) if "nth" in target else locator
+
+
+def _route(url: str) -> str:
+    parsed = urlparse(url)
+    return (parsed.path or "/") + (f"#{parsed.fragment}" if parsed.fragment else "")
+
+
+async def _element(page, target: dict):
+    locator = _locator(page, target)
+    element = locator if "nth" in target else locator.first
+    try:
+        await element.wait_for(state="visible", timeout=STEP_TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        raise CompiledTestFailure(f"cannot locate {json.dumps(target)}", unlocatable=True)
+    return element
+
+
+async def _run_step(page, step: dict, target_url: str):
+    op = step["op"]
+    if op == "goto":
+        await page.goto(urljoin(target_url, step.get("path", "/")), wait_until="load")
+    elif op == "click":
+        await (await _element(page, step["target"])).click(timeout=STEP_TIMEOUT_MS)
+    elif op == "fill":
+        await (await _element(page, step["target"])).fill(step.get("text", ""), timeout=STEP_TIMEOUT_MS)
+    elif op == "select":
+        await (await _element(page, step["target"])).select_option(label=step.get("text", ""), timeout=STEP_TIMEOUT_MS)
+    elif op == "press":
+        await page.keyboard.press(step["keys"])
+    elif op == "expect_visible":
+        await _element(page, step["target"])
+    elif op == "expect_hidden":
+        await expect(_locator(page, step["target"])).to_be_hidden(timeout=STEP_TIMEOUT_MS)
+    elif op == "expect_text":
+        await expect(await _element(page, step["target"])).to_contain_text(step.get("text", ""), timeout=STEP_TIMEOUT_MS)
+    elif op == "expect_value":
+        await expect(await _element(page, step["target"])).to_have_value(step.get("text", ""), timeout=STEP_TIMEOUT_MS)
+    elif op == "expect_count":
+        await expect(_locator(page, step["target"])).to_have_count(int(step["count"]), timeout=STEP_TIMEOUT_MS)
+    elif op == "expect_url":
+        deadline = time.monotonic() + STEP_TIMEOUT_MS / 1000
+        while not _route(page.url).endswith(step["path"]):
+            if time.monotonic() >= deadline:
+                raise AssertionError(f"expected route ending in {step['path']}, got {_route(page.url)}")
+            await asyncio.sleep(0.1)
+    else:
+        raise CompiledTestFailure(f"unsupported op {op}")
+
+
+async def run(test: dict, target_url: str, cdp_endpoint: str) -> dict:
+    """Execute a compiled test in a fresh context of the browser at `cdp_endpoint`."""
+    started = time.monotonic()
+    outcome = {"passed": False, "error": None, "unlocatable": False, "seconds": None}
+    reason = missing_assertions(test, test.get("criterion", ""))
+    if reason is not None:
+        outcome.update({"error": f"not a test: {reason}", "seconds": 0.0})
+        return outcome
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.connect_over_cdp(cdp_endpoint)
+            context = await browser.new_context(viewport={"width": 1280, "height": 1080})
+            try:
+                page = await context.new_page()
+                steps = test["steps"]
+                if not steps or steps[0]["op"] != "goto":
+                    await page.goto(target_url, wait_until="load")
+                for number, step in enumerate(steps, 1):
+                    try:
+                        await _run_step(page, step, target_url)
+                    except CompiledTestFailure as e:
+                        raise CompiledTestFailure(f"step {number} ({step['op']}): {e}", e.unlocatable)
+                    except (AssertionError, PlaywrightError) as e:
+                        raise CompiledTestFailure(f"step {number} ({step['op']}): {str(e).splitlines()[0]}")
+                outcome["passed"] = True
+            finally:
+                await context.close()
+    except CompiledTestFailure as e:
+        outcome["error"] = str(e)
+        outcome["unlocatable"] = e.unlocatable
+    except Exception as e:
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    outcome["seconds"] = round(time.monotonic() - started, 2)
+    with _lock:
+        stats["runs"] += 1
+        if outcome["passed"]:
+            stats["passed"] += 1
+        elif outcome["unlocatable"]:
+            stats["unlocatable"] += 1
+        else:
+            stats["assertion_failed"] += 1
+    return outcome
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
+
+
+compiled_test_store = CompiledTestStore()
@@ -0,0 +1,160 @@
+"""node_modules cache shared across validation rounds and jobs.
+
+Installs are keyed on a hash of the dependency manifest (package.json
+dependency fields plus any lockfile the app shipped with) and stored once
+under DEP_CACHE_DIR. On a
+hit, node_modules is materialized from the store with copy-on-write clones
+(APFS `cp -c`, reflinks on btrfs/XFS) or a plain copy, and npm install is
+skipped entirely. The store and the app never share inodes, so postinstall
+scripts or Vite's .vite cache writing into node_modules cannot corrupt it.
+"""
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from workspace import shipped_files
+
+DEP_CACHE_DIR = Path(os.environ.get("DEP_CACHE_DIR", str(Path.home() / ".cache" / "tddev" / "node_modules")))
+DEP_CACHE_MAX_ENTRIES = int(os.environ.get("DEP_CACHE_MAX_ENTRIES", "20"))
+DEP_CACHE_ENABLED = os.environ.get("DEP_CACHE", "1") != "0"
+
+_MANIFEST_FIELDS = (
+    "dependencies", "devDependencies", "optionalDependencies", "peerDependencies",
+    "overrides", "resolutions", "bundleDependencies", "engines",
+)
+_LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml")
+
+stats = {"hits": 0, "misses": 0, "saves": 0, "last_key": None, "last_hit": None}
+_lock = threading.Lock()
+
+
+def _node_version() -> str:
+    try:
+        return subprocess.run(["node", "--version"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _shipped_lockfiles(app_dir: Path) -> tuple:
+    # In a persistent workspace only lockfiles from the archive count: one npm (or a restore)
+    # wrote there in an earlier round would change the key of an unchanged manifest
+    shipped = shipped_files(app_dir)
+    return _LOCKFILES if shipped is None else tuple(name for name in _LOCKFILES if name in shipped)
+
+
+def cache_key(app_dir) -> str | None:
+    app_dir = Path(app_dir)
+    try:
+        with open(app_dir / "package.json", "r", encoding="utf-8") as f:
+            package = json.load(f)
+    except Exception:
+        return None
+    h = hashlib.sha256()
+    manifest = {field: package.get(field) for field in _MANIFEST_FIELDS if package.get(field) is not None}
+    h.update(json.dumps(manifest, sort_keys=True).encode("utf-8"))
+    for name in _shipped_lockfiles(app_dir):
+        lockfile = app_dir / name
+        if lockfile.is_file():
+            h.update(name.encode("utf-8"))
+            h.update(lockfile.read_bytes())
+    # Native modules are built for a specific platform and Node ABI
+    h.update(f"{platform.system()}-{platform.machine()}-{_node_version()}".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _clone_tree(src: Path, dst: Path):
+    # Copy-on-write where the filesystem supports it, otherwise a real copy:
+    # hardlinks would let an in-place write in one tree change every other one
+    if platform.system() == "Darwin":
+        command = ["cp", "-cR", str(src), str(dst)]  # APFS clonefile
+    else:
+        command = ["cp", "-a", "--reflink=auto", str(src), str(dst)]
+    try:
+        if subprocess.run(command, capture_output=True).returncode == 0:
+            return
+    except OSError:
+        pass
+    shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True)
+
+
+def restore(app_dir, key: str | None) -> bool:
+    """Materialize node_modules for `key` into app_dir; True on a cache hit."""
+    if not DEP_CACHE_ENABLED or key is None:
+        return False
+    entry = DEP_CACHE_DIR / key
+    with _lock:
+        stats["last_key"] = key
+        if not (entry / "node_modules").is_dir():
+            stats["misses"] += 1
+            stats["last_hit"] = False
+            return False
+    target = Path(app_dir) / "node_modules"
+    started = time.time()
+    try:
+        if target.exists():
+            shutil.rmtree(target)
+        _clone_tree(entry / "node_modules", target)
+        for name in _LOCKFILES:
+            if (entry / name).is_file() and not (Path(app_dir) / name).exists():
+                shutil.copy2(entry / name, Path(app_dir) / name)
+        os.utime(entry)
+    except Exception as e:
+        print(f"Dependency cache restore failed, falling back to npm install: {e}")
+        shutil.rmtree(target, ignore_errors=True)
+        with _lock:
+            stats["misses"] += 1
+            stats["last_hit"] = False
+        return False
+    with _lock:
+        stats["hits"] += 1
+        stats["last_hit"] = True
+    print(f"Dependency cache hit {key}: node_modules restored in {time.time() - started:.1f}s")
+    return True
+
+
+def save(app_dir, key: str | None):
+    """Store app_dir's freshly installed node_modules under `key`."""
+    if not DEP_CACHE_ENABLED or key is None:
+        return
+    source = Path(app_dir) / "node_modules"
+    entry = DEP_CACHE_DIR / key
+    if not source.is_dir() or entry.exists():
+        return
+    DEP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    staging = DEP_CACHE_DIR / f".{key}.{os.getpid()}.tmp"
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        _clone_tree(source, staging / "node_modules")
+        for name in _LOCKFILES:
+            if (Path(app_dir) / name).is_file():
+                shutil.copy2(Path(app_dir) / name, staging / name)
+        os.rename(staging, entry)
+    except Exception as e:
+        print(f"Dependency cache save failed: {e}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    with _lock:
+        stats["saves"] += 1
+    _evict()
+
+
+def _evict():
+    entries = [p for p in DEP_CACHE_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")]
+    if len(entries) <= DEP_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda p: p.stat().st_mtime)
+    for path in entries[:len(entries) - DEP_CACHE_MAX_ENTRIES]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
@@ -0,0 +1,214 @@
+"""Offline pre-flight check of package.json dependencies.
+
+Generated apps often depend on npm packages or versions that do not exist,
+which otherwise only shows up after a long failing `npm install`. Every
+registry dependency is resolved against a local registry metadata index
+instead, so such errors come back in milliseconds.
+
+NPM_INDEX_PATH points at the index, either:
+  * a directory of packuments, one per package at `<name>.json`,
+    `<name>/package.json` (verdaccio storage) or `<name>/index.json`; or
+  * a single `.json` / `.json.gz` file mapping each package name to its
+    packument or to a plain list of published versions.
+Without an index the check is skipped.
+"""
+import gzip
+import json
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+NPM_INDEX_PATH = os.environ.get("NPM_INDEX_PATH", "")
+DEPENDENCY_FIELDS = ("dependencies", "devDependencies", "optionalDependencies")
+
+_VERSION = re.compile(r"^v?(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$")
+_PARTIAL = re.compile(r"^v?(\d+|[xX*])(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$")
+_COMPARATOR = re.compile(r"^(<=|>=|<|>|=|\^|~>?)?(.*)$")
+_HYPHEN = re.compile(r"^\s*(\S+)\s+-\s+(\S+)\s*$")
+# Specifiers that do not resolve through the registry
+_NON_REGISTRY = re.compile(r"^(file:|link:|workspace:|portal:|patch:|git\+|git:|github:|gitlab:|bitbucket:|https?:|[\w.-]+/[\w.-]+(#.*)?$)")
+
+
+def _pre_key(pre: str | None):
+    if not pre:
+        return (1,)
+    return (0,) + tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in pre.split("."))
+
+
+def _version_key(version: str):
+    match = _VERSION.match(version.strip())
+    if not match:
+        return None
+    major, minor, patch, pre = match.groups()
+    return (int(major), int(minor), int(patch), _pre_key(pre))
+
+
+def _key(major, minor, patch, pre=None):
+    return (major, minor, patch, _pre_key(pre))
+
+
+def _floor(major, minor, patch):
+    """Lowest possible version of major.minor.patch, i.e. its `-0` prerelease."""
+    return _key(major, minor, patch, "0")
+
+
+def _desugar(op: str, text: str):
+    """One range token -> ([(op, key), ...], prerelease triple or None); raises ValueError."""
+    match = _PARTIAL.match(text)
+    if not match:
+        raise ValueError(text)
+    parts = [None if p is None or p in "xX*" else int(p) for p in match.groups()[:3]]
+    pre = match.group(4)
+    major, minor, patch = parts
+    if major is None:
+        return ([("<", _key(0, 0, 0, "0"))] if op in ("<", ">") else []), None
+    explicit = (major, minor, patch) if pre and patch is not None else None
+    if minor is None:
+        lower, upper = _key(major, 0, 0), _floor(major + 1, 0, 0)
+    elif patch is None:
+        lower, upper = _key(major, minor, 0), _floor(major, minor + 1, 0)
+    else:
+        lower, upper = _key(major, minor, patch, pre), None
+
+    if op == "^":
+        base = (major, minor or 0, patch or 0)
+        if major > 0 or minor is None:
+            upper = _floor(major + 1, 0, 0)
+        elif minor > 0 or patch is None:
+            upper = _floor(0, minor + 1, 0)
+        else:
+            upper = _floor(0, 0, patch + 1)
+        return [(">=", _key(*base, pre)), ("<", upper)], explicit
+    if op in ("~", "~>"):
+        upper = _floor(major + 1, 0, 0) if minor is None else _floor(major, minor + 1, 0)
+        return [(">=", _key(major, minor or 0, patch or 0, pre)), ("<", upper)], explicit
+    if op in ("", "="):
+        return ([(">=", lower), ("<", upper)] if upper else [("=", lower)]), explicit
+    if op == ">=":
+        return [(">=", lower)], explicit
+    if op == "<":
+        return [("<", _floor(*lower[:3]) if upper else lower)], explicit
+    if op == ">":
+        return [(">=", upper)] if upper else [(">", lower)], explicit
+    if op == "<=":
+        return [("<", upper)] if upper else [("<=", lower)], explicit
+    raise ValueError(op)
+
+
+def _parse_range(spec: str):
+    """npm range -> list of comparator sets, each ([(op, key), ...], [prerelease triples])."""
+    sets = []
+    for part in spec.split("||"):
+        part = part.strip()
+        comparators, explicit = [], []
+        hyphen = _HYPHEN.match(part)
+        if hyphen:
+            low, low_pre = _desugar(">=", hyphen.group(1))
+            high, high_pre = _desugar("<=", hyphen.group(2))
+            comparators, explicit = low + high, [low_pre, high_pre]
+        else:
+            part = re.sub(r"(<=|>=|<|>|=|\^|~>?)\s+", r"\1", part)
+            for token in part.split() or ["*"]:
+                op, text = _COMPARATOR.match(token).groups()
+                tokens, pre = _desugar(op or "", text)
+                comparators += tokens
+                explicit.append(pre)
+        sets.append((comparators, [e for e in explicit if e]))
+    return sets
+
+
+def _satisfies(key, comparator_set) -> bool:
+    comparators, explicit = comparator_set
+    if key[3] != (1,) and key[:3] not in explicit:
+        return False
+    for op, bound in comparators:
+        if not {"<": key < bound, "<=": key <= bound, ">": key > bound, ">=": key >= bound, "=": key == bound}[op]:
+            return False
+    return True
+
+
+def max_satisfying(versions, spec: str):
+    """Highest of `versions` matching the npm range `spec`; raises ValueError if `spec` is not a range."""
+    sets = _parse_range(spec)
+    keyed = [(key, v) for v in versions if (key := _version_key(v)) is not None]
+    matching = [(key, v) for key, v in keyed if any(_satisfies(key, s) for s in sets)]
+    return max(matching)[1] if matching else None
+
+
+class RegistryIndex:
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._table = None
+
+    def _load_table(self) -> dict:
+        if self._table is None:
+            opener = gzip.open if self.path.suffix == ".gz" else open
+            with opener(self.path, "rt", encoding="utf-8") as f:
+                self._table = json.load(f)
+        return self._table
+
+    @lru_cache(maxsize=4096)
+    def packument(self, name: str):
+        """(versions, dist-tags) for `name`, or None if the index has no such package."""
+        if self.path.is_dir():
+            entry = None
+            for candidate in (self.path / f"{name}.json", self.path / name / "package.json", self.path / name / "index.json"):
+                if candidate.is_file():
+                    with open(candidate, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                    break
+        else:
+            entry = self._load_table().get(name)
+        if entry is None:
+            return None
+        if isinstance(entry, list):
+            return list(entry), {}
+        versions = entry.get("versions", {})
+        return list(versions), entry.get("dist-tags", {})
+
+
+@lru_cache(maxsize=4)
+def _index(path: str) -> RegistryIndex:
+    return RegistryIndex(path)
+
+
+def check(app_dir, index_path: str | None = None) -> list[str]:
+    """Human-readable errors for dependencies the index cannot resolve; [] when all resolve
+    or no index is configured."""
+    index_path = index_path if index_path is not None else NPM_INDEX_PATH
+    if not index_path or not Path(index_path).exists():
+        return []
+    try:
+        with open(Path(app_dir) / "package.json", "r", encoding="utf-8") as f:
+            package = json.load(f)
+    except Exception as e:
+        return [f"package.json could not be read: {e}"]
+
+    index = _index(index_path)
+    errors = []
+    for field in DEPENDENCY_FIELDS:
+        for name, spec in (package.get(field) or {}).items():
+            spec = str(spec).strip()
+            if spec.startswith("npm:"):
+                # Alias: "npm:real-name@range"
+                name, _, spec = spec[4:].rpartition("@") if "@" in spec[5:] else (spec[4:], "", "*")
+            if _NON_REGISTRY.match(spec):
+                continue
+            entry = index.packument(name)
+            if entry is None:
+                errors.append(f"Package \"{name}\" ({field}) does not exist on the npm registry.")
+                continue
+            versions, tags = entry
+            if spec in tags or (spec == "latest" and versions):
+                continue
+            try:
+                if max_satisfying(versions, spec or "*") is None:
+                    latest = tags.get("latest") or max(versions, key=lambda v: _version_key(v) or (-1,), default=None)
+                    errors.append(f"No version of \"{name}\" matches \"{spec}\" ({field}); the latest published version is {latest}.")
+            except ValueError:
+                # Unrecognized specifier: leave it to npm
+                continue
+    if errors:
+        print(f"Dependency pre-flight found {len(errors)} problem(s)")
+    return errors
@@ -0,0 +1,325 @@
+"""Parsing layer for JSON stage outputs.
+
+Extracts the JSON payload from prose and code fences, repairs common LLM
+defects locally (trailing commas, missing commas between strings, unescaped
+quotes, raw newlines in strings) and validates the result against a per-stage
+schema, so a stage only has to be re-asked when the output cannot be repaired.
+Truncated output is reported as invalid rather than closed, since closing it
+would silently drop elements.
+"""
+import json
+import re
+
+_FENCE = re.compile(r"```[A-Za-z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+# Minimal schema language: {"type": ..., "items": ..., "properties": {...}, "required": [...],
+# "anyOf": [...], "minItems": n}
+STRING = {"type": "string"}
+STAGE_SCHEMAS = {
+    "REQUIREMENTS": {"type": "array", "minItems": 1, "items": STRING},
+    "REQUIREMENT_LIST": {
+        "type": "array",
+        "minItems": 1,
+        "items": {
+            "type": "object",
+            "required": ["resource_dependency", "function", "static_description", "interaction_and_states"],
+            "properties": {
+                "resource_dependency": {"type": "object"},
+                "function": STRING,
+                "static_description": STRING,
+                "interaction_and_states": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "required": ["interaction", "description"],
+                        "properties": {"interaction": STRING, "description": STRING},
+                    },
+                },
+            },
+        },
+    },
+    "TEST_CRITERIA": {
+        "type": "array",
+        "minItems": 1,
+        "items": {
+            "type": "object",
+            "required": ["requirement_tested", "narrative_steps"],
+            "properties": {
+                "requirement_tested": STRING,
+                "user_persona": STRING,
+                "user_goal": STRING,
+                "narrative_steps": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "object",
+                        "required": ["action", "expected_outcome"],
+                        "properties": {"action": STRING, "expected_outcome": STRING},
+                    },
+                },
+            },
+        },
+    },
+    "TEST_CRITERIA_DEEPSEEK": {
+        "type": "array",
+        "minItems": 1,
+        "items": {"anyOf": [STRING, {"type": "object", "required": ["test_case"]}]},
+    },
+    "COMPILED_TEST": {
+        "type": "object",
+        "required": ["compilable", "steps"],
+        "properties": {
+            "compilable": {"type": "boolean"},
+            "steps": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["op"],
+                    "properties": {
+                        "op": {"type": "string", "enum": [
+                            "goto", "click", "fill", "select", "press", "expect_visible", "expect_hidden",
+                            "expect_text", "expect_value", "expect_count", "expect_url",
+                        ]},
+                        "target": {"type": "object"},
+                        "text": STRING,
+                        "path": STRING,
+                        "keys": STRING,
+                        "count": {"type": "number"},
+                    },
+                },
+            },
+        },
+    },
+    "SCREENSHOT": {
+        "type": "object",
+        "required": ["loading_success", "detail"],
+        "properties": {"loading_success": {"type": "string", "enum": ["True", "False"]}, "detail": STRING},
+    },
+}
+
+_TYPES = {"array": list, "object": dict, "string": str, "number": (int, float), "boolean": bool}
+
+
+def schema_errors(value, schema, path="$"):
+    if "anyOf" in schema:
+        if any(not schema_errors(value, option, path) for option in schema["anyOf"]):
+            return []
+        return [f"{path}: does not match any allowed shape"]
+    expected = schema.get("type")
+    if expected and not isinstance(value, _TYPES[expected]):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: expected one of {schema['enum']}, got {value!r}"]
+    errors = []
+    if expected == "array":
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(schema_errors(item, schema["items"], f"{path}[{i}]"))
+    elif expected == "object":
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing '{name}'")
+        for name, sub in schema.get("properties", {}).items():
+            if name in value:
+                errors.extend(schema_errors(value[name], sub, f"{path}.{name}"))
+    return errors
+
+
+def extract_json_payload(text, expect="array"):
+    """Return the substring that most likely holds the JSON value, dropping prose and fences."""
+    text = text.strip()
+    fenced = [m.group(1).strip() for m in _FENCE.finditer(text)]
+    opener = {"array": "[", "object": "{"}.get(expect)
+    for block in fenced:
+        if block[:1] in ("[", "{") and (opener is None or block[0] == opener):
+            text = block
+            break
+    start = text.find(opener) if opener else min((i for i in (text.find("["), text.find("{")) if i >= 0), default=-1)
+    if start < 0:
+        return text
+    end = _scan(text, start)["end"]
+    return text[start:end] if end is not None else text[start:]
+
+
+def _scan(text, start=0):
+    """String-aware bracket scan from `start`; reports where the top-level value ends (if it does)."""
+    stack = []
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append(ch)
+        elif ch in "]}":
+            if stack:
+                stack.pop()
+            if not stack:
+                return {"end": i + 1}
+    return {"end": None}
+
+
+def _fix_strings(text):
+    """Escape raw newlines and quotes that do not terminate their string."""
+    out = []
+    in_string = False
+    escape = False
+    n = len(text)
+    for i, ch in enumerate(text):
+        if not in_string:
+            out.append(ch)
+            if ch == '"':
+                in_string = True
+            continue
+        if escape:
+            out.append(ch)
+            escape = False
+        elif ch == "\\":
+            out.append(ch)
+            escape = True
+        elif ch == '"':
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j >= n or text[j] in ",:]}":
+                out.append(ch)
+                in_string = False
+            elif text[j] == '"':
+                # `"a" "b"`: two values with the comma missing, not a quote inside one string
+                out.append(ch + ",")
+                in_string = False
+            else:
+                out.append('\\"')
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            continue
+        elif ch == "\t":
+            out.append("\\t")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _strip_trailing_commas(text):
+    out = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "]}":
+            k = len(out) - 1
+            while k >= 0 and out[k] in " \t\r\n":
+                k -= 1
+            if k >= 0 and out[k] == ",":
+                del out[k]
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text):
+    """Close a truncated document, keeping only the complete elements of the top-level array/object."""
+    stack = []
+    in_string = False
+    escape = False
+    last_complete = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if len(stack) == 1 and stack[0] == "[":
+                    last_complete = i + 1
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append(ch)
+        elif ch in "]}":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text
+            if len(stack) == 1:
+                last_complete = i + 1
+    if not stack:
+        return text
+    if stack[0] == "[" and last_complete is not None:
+        return text[:last_complete] + "]"
+    tail = '"' if in_string else ""
+    closers = "".join("]" if opener == "[" else "}" for opener in reversed(stack))
+    return _strip_trailing_commas(text + tail + closers)
+
+
+def repair_json(text):
+    """Return (repaired, lossy); closing a truncated document is lossy because whatever
+    the model had not written yet, and any incomplete trailing element, is missing."""
+    text = _strip_trailing_commas(_fix_strings(text))
+    closed = _close_truncated(text)
+    return closed, closed != text
+
+
+def _looks_truncated(payload):
+    # A stream cut off early stops mid-document; a complete output ends with the closer of its opener
+    stripped = payload.strip()
+    closer = {"[": "]", "{": "}"}.get(stripped[:1])
+    return closer is None or not stripped.endswith(closer)
+
+
+def parse_stage_output(text, stage=None, expect="array"):
+    """Parse a stage's raw output into JSON, repairing it locally when needed.
+
+    Returns (is_valid, parsed, error_msg) like app.validate_json_string, so callers only
+    re-ask the model when `is_valid` is False.
+    """
+    if text is None:
+        return False, None, "Empty response"
+    payload = extract_json_payload(text, expect)
+    schema = STAGE_SCHEMAS.get(stage)
+    error_msg = None
+    lossy = False
+    for candidate in (payload, None):
+        try:
+            if candidate is None:
+                candidate, lossy = repair_json(payload)
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            error_msg = str(e)
+            continue
+        errors = schema_errors(parsed, schema) if schema else []
+        if not errors and lossy:
+            # Valid-looking but incomplete: re-ask instead of persisting a partial result
+            if _looks_truncated(payload):
+                error_msg = f"{stage or 'JSON'} output is truncated; repairing it would drop content"
+            else:
+                error_msg = f"{stage or 'JSON'} output is unrepairable (e.g. an unescaped quote); repairing it would drop content"
+            break
+        if not errors:
+            if candidate is not payload or payload != text.strip():
+                print(f"Repaired {stage or 'JSON'} output locally")
+            return True, parsed, None
+        error_msg = "; ".join(errors[:5])
+    print(error_msg)
+    return False, None, error_msg
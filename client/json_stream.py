@@ -0,0 +1,219 @@
+"""Incremental JSON validation for streamed LLM completions.
+
+`JsonStreamValidator` is fed the completion chunk by chunk and raises
+`MalformedStreamError` as soon as the text seen so far can no longer be the
+prefix of a valid JSON document, so the stream can be aborted early. In
+lenient mode it only aborts on defects json_repair cannot fix locally.
+"""
+import re
+
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$")
+_LITERALS = ("true", "false", "null")
+_LITERAL_CHARS = set("truefalsn")
+_NUMBER_CHARS = set("0123456789+-.eE")
+MAX_PREAMBLE = 2000
+
+
+class MalformedStreamError(ValueError):
+    def __init__(self, message, partial="") -> None:
+        super().__init__(message)
+        self.partial = partial
+
+
+class JsonStreamValidator:
+    """Grammar-aware prefix check for a single top-level JSON value.
+
+    A leading ``` / ```json fence line and a trailing ``` fence are tolerated,
+    matching what OpenAILLM.ask strips from the final text. With `lenient=True`,
+    prose around the value, trailing commas, raw newlines and unescaped quotes in
+    strings are tolerated too (see json_repair.repair_json); a stream that ends
+    early is not aborted here but rejected by json_repair.parse_stage_output.
+    """
+    def __init__(self, expect="array", lenient=False) -> None:
+        self.expect = expect
+        self.lenient = lenient
+        self._preamble = 0
+        self._pending_quote = False
+        self.text = ""
+        self._fence = ""
+        self._started = False
+        self._done = False
+        self._stack = []
+        # What the grammar allows next: "value", "value_or_close", "key_or_close",
+        # "key", "colon", "comma_or_close"
+        self._want = "value"
+        self._in_string = False
+        self._escape = False
+        self._unicode = 0
+        self._is_key = False
+        self._token = ""
+
+    def _fail(self, message):
+        raise MalformedStreamError(message, self.text)
+
+    def feed(self, chunk):
+        self.text += chunk
+        for ch in chunk:
+            self._feed_char(ch)
+
+    def close(self):
+        """Call after the stream ends; raises if the document is incomplete."""
+        if self._token:
+            self._end_token()
+        if not self._done and not self.lenient:
+            self._fail("Stream ended before the JSON value was complete")
+
+    def _feed_char(self, ch):
+        if not self._started and self.lenient:
+            opener = {"array": "[", "object": "{"}.get(self.expect)
+            if ch == opener or (opener is None and ch in "[{"):
+                self._started = True
+            else:
+                self._preamble += 1
+                if self._preamble > MAX_PREAMBLE:
+                    self._fail("No JSON value found in the output")
+                return
+        if not self._started:
+            if self._fence:
+                self._fence += ch
+                if ch == "\n":
+                    self._fence = ""
+                elif not re.match(r"`{1,3}[A-Za-z]*$", self._fence):
+                    self._fail(f"Unexpected fence line {self._fence!r}")
+                return
+            if ch.isspace():
+                return
+            if ch == "`":
+                self._fence = ch
+                return
+            if self.expect == "array" and ch != "[":
+                self._fail(f"Expected a JSON array, got {ch!r}")
+            if self.expect == "object" and ch != "{":
+                self._fail(f"Expected a JSON object, got {ch!r}")
+            self._started = True
+
+        if self._done:
+            if not self.lenient and not (ch.isspace() or ch == "`"):
+                self._fail(f"Unexpected {ch!r} after the end of the JSON value")
+            return
+
+        if self._pending_quote:
+            if ch.isspace():
+                return
+            self._pending_quote = False
+            if ch in ",:]}":
+                self._close_string()
+            else:
+                # The previous quote was an unescaped quote inside the string
+                self._feed_string(ch)
+                return
+
+        if self._in_string:
+            self._feed_string(ch)
+            return
+
+        if self._token:
+            if ch in _NUMBER_CHARS or ch in _LITERAL_CHARS:
+                self._token += ch
+                self._check_token_prefix()
+                return
+            self._end_token()
+
+        if ch.isspace():
+            return
+        if ch == '"':
+            if self._want in ("key", "key_or_close"):
+                self._is_key = True
+            elif self._want in ("value", "value_or_close"):
+                self._is_key = False
+            else:
+                self._fail(f"Unexpected string where {self._want} was expected")
+            self._in_string = True
+            return
+        if ch in "[{":
+            if self._want not in ("value", "value_or_close"):
+                self._fail(f"Unexpected {ch!r} where {self._want} was expected")
+            self._stack.append(ch)
+            self._want = "value_or_close" if ch == "[" else "key_or_close"
+            return
+        if ch in "]}":
+            if not self._stack:
+                self._fail(f"Unbalanced {ch!r}")
+            opener = self._stack[-1]
+            if (opener, ch) not in (("[", "]"), ("{", "}")):
+                self._fail(f"Mismatched {ch!r} closing {opener!r}")
+            allowed = ("comma_or_close", "value_or_close" if ch == "]" else "key_or_close")
+            if self.lenient:
+                # Trailing comma
+                allowed += ("value", "key")
+            if self._want not in allowed:
+                self._fail(f"Unexpected {ch!r} where {self._want} was expected")
+            self._stack.pop()
+            self._end_value()
+            return
+        if ch == ",":
+            if self._want != "comma_or_close":
+                self._fail(f"Unexpected ',' where {self._want} was expected")
+            self._want = "value" if self._stack[-1] == "[" else "key"
+            return
+        if ch == ":":
+            if self._want != "colon":
+                self._fail(f"Unexpected ':' where {self._want} was expected")
+            self._want = "value"
+            return
+        if ch in _NUMBER_CHARS or ch in _LITERAL_CHARS:
+            if self._want not in ("value", "value_or_close"):
+                self._fail(f"Unexpected {ch!r} where {self._want} was expected")
+            self._token = ch
+            self._check_token_prefix()
+            return
+        self._fail(f"Unexpected character {ch!r}")
+
+    def _feed_string(self, ch):
+        if self._unicode:
+            if ch not in "0123456789abcdefABCDEF":
+                self._fail("Invalid \\u escape")
+            self._unicode -= 1
+            return
+        if self._escape:
+            if ch == "u":
+                self._unicode = 4
+            elif ch not in '"\\/bfnrt':
+                self._fail(f"Invalid escape \\{ch}")
+            self._escape = False
+            return
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            if self.lenient:
+                self._pending_quote = True
+            else:
+                self._close_string()
+        elif ch in "\n\r" and not self.lenient:
+            self._fail("Unescaped newline inside a string")
+
+    def _close_string(self):
+        self._in_string = False
+        if self._is_key:
+            self._want = "colon"
+        else:
+            self._end_value()
+
+    def _check_token_prefix(self):
+        token = self._token
+        if token[0] in _LITERAL_CHARS:
+            if not any(lit.startswith(token) for lit in _LITERALS):
+                self._fail(f"Invalid literal {token!r}")
+
+    def _end_token(self):
+        token, self._token = self._token, ""
+        if token in _LITERALS or _NUMBER.match(token):
+            self._end_value()
+        else:
+            self._fail(f"Invalid token {token!r}")
+
+    def _end_value(self):
+        if self._stack:
+            self._want = "comma_or_close"
+        else:
+            self._done = True
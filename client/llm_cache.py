@@ -0,0 +1,179 @@
+"""Content-addressed on-disk cache for LLM responses.
+
+Entries are keyed on a hash of everything that determines a completion
+(model, base_url, rendered prompt, image bytes, prompt template version), so
+re-running a job never re-pays for an identical earlier call.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "llm"
+CACHE_DIR = Path(os.environ.get("LLM_CACHE_DIR", str(DEFAULT_CACHE_DIR)))
+CACHE_MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_MAX_AGE = int(float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 60 * 60)
+CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+
+
+def make_key(model, base_url, prompt, images=(), version=""):
+    h = hashlib.sha256()
+    for part in (model, base_url or "", version, prompt):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    for img in images:
+        if img:
+            h.update(img.encode("utf-8") if isinstance(img, str) else img)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class _OwnerCancelled(Exception):
+    pass
+
+
+class ResponseCache:
+    """LRU (by last access time) response store with size and age limits.
+
+    Identical in-flight requests are de-duplicated: the first caller computes,
+    every concurrent caller with the same key waits for and shares its result.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._inflight: dict[str, threading.Event] = {}
+        self._async_inflight: dict[str, asyncio.Future] = {}
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if self.max_age and time.time() - entry.get("created", 0) > self.max_age:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("response")
+
+    def put(self, key, response, meta=None):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "meta": meta or {}, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        if not self.cache_dir.is_dir():
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if self.max_age and now - st.st_mtime > self.max_age:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def get_or_compute(self, key, compute, use_cache=True, meta=None):
+        """Return (response, hit). `compute` is only run by one caller per key at a time."""
+        while True:
+            if use_cache:
+                cached = self.get(key)
+                if cached is not None:
+                    return cached, True
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    owner = True
+                else:
+                    owner = False
+            if owner:
+                break
+            event.wait()
+            use_cache = True
+        try:
+            response = compute()
+            self.put(key, response, meta)
+            return response, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    async def aget_or_compute(self, key, compute, use_cache=True, meta=None):
+        """Awaitable variant of get_or_compute; `compute` is a coroutine function."""
+        while True:
+            if use_cache:
+                cached = self.get(key)
+                if cached is not None:
+                    return cached, True
+            future = self._async_inflight.get(key)
+            if future is None or future.done() or future.get_loop() is not asyncio.get_running_loop():
+                break
+            try:
+                return await asyncio.shield(future), True
+            except _OwnerCancelled:
+                # The computing task was cancelled, not this one: take over the key
+                use_cache = True
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        try:
+            response = await compute()
+            self.put(key, response, meta)
+            future.set_result(response)
+            return response, False
+        except asyncio.CancelledError:
+            # Cancelling the shared future would cancel every coalesced waiter too
+            future.set_exception(_OwnerCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            if self._async_inflight.get(key) is future:
+                self._async_inflight.pop(key, None)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,148 @@
+"""Local load-failure detection for the initial screenshot step.
+
+While the screenshot is taken, the page is instrumented to record the main
+document's HTTP status, uncaught exceptions, console errors and failed
+requests, plus a few DOM facts (Vite error overlay, an empty mount node) and
+how uniform the screenshot is. Clear failures are reported with that concrete
+error text without asking the vision model; only inconclusive pages go to the
+LLM judge. A uniform screenshot only counts as a failure when the page also has
+no text or threw an uncaught exception.
+"""
+
+# Fraction of (downsampled) pixels sharing the dominant colour above which a page counts as blank
+BLANK_THRESHOLD = 0.995
+MAX_ITEMS = 10
+
+_IGNORED_URL_SUFFIXES = ("/favicon.ico",)
+
+_DOM_PROBE = """() => {
+    const overlay = document.querySelector("vite-error-overlay");
+    let overlayText = null;
+    if (overlay && overlay.shadowRoot) {
+        const message = overlay.shadowRoot.querySelector(".message");
+        const file = overlay.shadowRoot.querySelector(".file");
+        overlayText = [message && message.innerText, file && file.innerText].filter(Boolean).join("\\n");
+    }
+    const root = document.querySelector("#root, #app, #__next");
+    return {
+        error_overlay: overlay ? (overlayText || "Vite error overlay shown") : null,
+        mount_empty: root ? root.childElementCount === 0 && !root.innerText.trim() : null,
+        text_length: document.body ? document.body.innerText.trim().length : 0,
+    };
+}"""
+
+# Downscale the screenshot on a canvas and return the share of pixels in the most common colour bucket
+_UNIFORM_RATIO = """async ([b64, mime]) => {
+    const img = new Image();
+    img.src = "data:" + mime + ";base64," + b64;
+    await img.decode();
+    const w = 96, h = Math.max(1, Math.round(w * img.height / img.width));
+    const canvas = document.createElement("canvas");
+    canvas.width = w;
+    canvas.height = h;
+    const ctx = canvas.getContext("2d");
+    ctx.drawImage(img, 0, 0, w, h);
+    const data = ctx.getImageData(0, 0, w, h).data;
+    const counts = new Map();
+    let best = 0;
+    for (let i = 0; i < data.length; i += 4) {
+        const bucket = ((data[i] >> 3) << 10) | ((data[i + 1] >> 3) << 5) | (data[i + 2] >> 3);
+        const count = (counts.get(bucket) || 0) + 1;
+        counts.set(bucket, count);
+        if (count > best) best = count;
+    }
+    return best / (w * h);
+}"""
+
+
+def new_signals(url: str) -> dict:
+    return {
+        "url": url,
+        "http_status": None,
+        "navigation_error": None,
+        "page_errors": [],
+        "console_errors": [],
+        "failed_requests": [],
+        "error_overlay": None,
+        "mount_empty": None,
+        "text_length": None,
+        "uniform_ratio": None,
+    }
+
+
+def _ignored(url: str) -> bool:
+    return url.split("?", 1)[0].endswith(_IGNORED_URL_SUFFIXES)
+
+
+def attach(page, signals: dict):
+    """Record errors on `page` into `signals`; call before navigating."""
+    def on_console(msg):
+        if msg.type == "error" and not _ignored((msg.location or {}).get("url", "")):
+            signals["console_errors"].append(msg.text[:1000])
+
+    def on_request_failed(req):
+        if not _ignored(req.url):
+            signals["failed_requests"].append(f"{req.method} {req.url}: {req.failure or 'failed'}")
+
+    def on_response(response):
+        if response.status >= 400 and not _ignored(response.url) and response.request.resource_type != "document":
+            signals["failed_requests"].append(f"{response.request.method} {response.url}: HTTP {response.status}")
+
+    page.on("pageerror", lambda error: signals["page_errors"].append(str(error)[:2000]))
+    page.on("console", on_console)
+    page.on("requestfailed", on_request_failed)
+    page.on("response", on_response)
+
+
+async def inspect(page, signals: dict, image_base64: str | None = None, mime: str = "image/png"):
+    """Fill in the DOM facts and, given the (first) screenshot, its uniformity."""
+    try:
+        signals.update(await page.evaluate(_DOM_PROBE))
+    except Exception as e:
+        print(f"DOM probe failed: {e}")
+    if image_base64:
+        # Decoded in a blank tab of the same browser, so no imaging library is needed here
+        scratch = await page.context.new_page()
+        try:
+            signals["uniform_ratio"] = round(await scratch.evaluate(_UNIFORM_RATIO, [image_base64, mime]), 4)
+        except Exception as e:
+            print(f"Screenshot uniformity check failed: {e}")
+        finally:
+            await scratch.close()
+
+
+def _section(title: str, items: list[str]) -> str:
+    lines = [f"{title}:"] + [f"- {item}" for item in items[:MAX_ITEMS]]
+    if len(items) > MAX_ITEMS:
+        lines.append(f"- ... and {len(items) - MAX_ITEMS} more")
+    return "\n".join(lines)
+
+
+def assess(signals: dict) -> tuple[str, str]:
+    """("failed", detail) when the signals alone show the page did not load, else ("inconclusive", detail)."""
+    reasons = []
+    if signals["navigation_error"]:
+        reasons.append(f"Navigating to {signals['url']} failed: {signals['navigation_error']}")
+    if signals["http_status"] is not None and signals["http_status"] >= 400:
+        reasons.append(f"The page {signals['url']} responded with HTTP {signals['http_status']}.")
+    if signals["error_overlay"]:
+        reasons.append(f"The dev server shows an error overlay:\n{signals['error_overlay']}")
+    if signals["mount_empty"]:
+        reasons.append("The app's mount element (#root/#app) is empty: the application did not render.")
+    blank = signals["uniform_ratio"] is not None and signals["uniform_ratio"] >= BLANK_THRESHOLD
+    # Sparse or tall pages can look uniform once downscaled, so blankness alone is not proof
+    if blank and (signals["text_length"] == 0 or signals["page_errors"]):
+        reasons.append(f"The screenshot is blank ({signals['uniform_ratio']:.1%} of it is a single colour).")
+
+    evidence = []
+    if blank and not reasons:
+        evidence.append(f"The screenshot is nearly uniform ({signals['uniform_ratio']:.1%} of it is a single colour).")
+    if signals["page_errors"]:
+        evidence.append(_section("Uncaught exceptions", signals["page_errors"]))
+    if signals["console_errors"]:
+        evidence.append(_section("Console errors", signals["console_errors"]))
+    if signals["failed_requests"]:
+        evidence.append(_section("Failed requests", signals["failed_requests"]))
+
+    detail = "\n".join(reasons + evidence)
+    return ("failed" if reasons else "inconclusive"), detail
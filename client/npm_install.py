@@ -0,0 +1,162 @@
+"""npm install with speculative fallback strategies.
+
+The plain install, `--force` and `--legacy-peer-deps` are started together,
+each in its own scratch copy of the app, instead of one after the other.
+Strategies keep the baseline's order of preference: a fallback that succeeds
+first only wins once every strategy before it has failed, or after
+FALLBACK_GRACE seconds, so the plain tree is used whenever it installs. The
+winner has its node_modules (and lockfile) moved into the app and the others
+are killed. When all of them fail, the stderr of every
+attempt is kept so it can go into the feedback prompt.
+"""
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+STRATEGIES = ("npm install", "npm install --force", "npm install --legacy-peer-deps")
+INSTALL_TIMEOUT = int(os.environ.get("NPM_INSTALL_TIMEOUT", "600"))
+SPECULATIVE_INSTALL = os.environ.get("SPECULATIVE_INSTALL", "1") != "0"
+# How long a finished fallback waits for the strategies preferred over it
+FALLBACK_GRACE = float(os.environ.get("NPM_FALLBACK_GRACE", "20"))
+# Top-level entries not copied into the scratch installs
+_SCRATCH_EXCLUDE = {"node_modules", ".git", ".tddev_dist", "log"}
+STDERR_TAIL = 3000
+
+
+class InstallError(RuntimeError):
+    def __init__(self, attempts: list[dict]) -> None:
+        self.attempts = attempts
+        lines = ["All npm install strategies failed:"]
+        for attempt in attempts:
+            lines.append(f"$ {attempt['command']} ({attempt['outcome']} after {attempt['seconds']}s)")
+            lines.append(attempt["stderr"] or "(no stderr)")
+        super().__init__("\n".join(lines))
+
+
+class _Attempt:
+    def __init__(self, command: str, cwd: Path) -> None:
+        self.command = command
+        self.cwd = cwd
+        self.process = None
+        self.started = None
+        self.outcome = None
+        self._stderr = tempfile.TemporaryFile()
+
+    def start(self):
+        self.started = time.time()
+        # Own process group, so cancelling also kills the children npm spawns
+        self.process = subprocess.Popen(
+            self.command, shell=True, cwd=str(self.cwd),
+            stdout=subprocess.DEVNULL, stderr=self._stderr, start_new_session=True,
+        )
+        return self
+
+    def poll(self) -> int | None:
+        code = self.process.poll()
+        if code is not None and self.outcome is None:
+            self.outcome = "ok" if code == 0 else f"exit {code}"
+        return code
+
+    def cancel(self, outcome: str):
+        if self.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+                self.process.wait(timeout=10)
+            except (ProcessLookupError, subprocess.TimeoutExpired):
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self.outcome = outcome
+
+    def report(self) -> dict:
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode("utf-8", errors="ignore")
+        self._stderr.close()
+        return {
+            "command": self.command,
+            "outcome": self.outcome,
+            "seconds": round(time.time() - self.started, 1),
+            "stderr": stderr[-STDERR_TAIL:].strip(),
+        }
+
+
+def _scratch_copy(app_dir: Path, index: int) -> Path:
+    scratch = app_dir.parent / f".{app_dir.name}.install-{index}"
+    shutil.rmtree(scratch, ignore_errors=True)
+    shutil.copytree(
+        app_dir, scratch, symlinks=True,
+        ignore=lambda directory, names: [n for n in names if n in _SCRATCH_EXCLUDE] if Path(directory) == app_dir else [],
+    )
+    return scratch
+
+
+def _adopt(scratch: Path, app_dir: Path):
+    target = app_dir / "node_modules"
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(scratch / "node_modules", target)
+    lockfile = scratch / "package-lock.json"
+    if lockfile.is_file():
+        shutil.copy2(lockfile, app_dir / "package-lock.json")
+
+
+def _install_sequential(app_dir: Path, strategies, timeout: int) -> dict:
+    reports = []
+    for command in strategies:
+        attempt = _Attempt(command, app_dir).start()
+        try:
+            attempt.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            attempt.cancel("timeout")
+        attempt.poll()
+        reports.append(attempt.report())
+        if attempt.outcome == "ok":
+            return reports[-1]
+    raise InstallError(reports)
+
+
+def install(app_dir, strategies=STRATEGIES, timeout: int = INSTALL_TIMEOUT, speculative: bool | None = None) -> dict:
+    """Install app_dir's dependencies; returns the winning attempt or raises InstallError."""
+    app_dir = Path(app_dir)
+    if speculative is None:
+        speculative = SPECULATIVE_INSTALL
+    if not speculative or len(strategies) == 1:
+        return _install_sequential(app_dir, strategies, timeout)
+
+    attempts = []
+    try:
+        for index, command in enumerate(strategies):
+            attempts.append(_Attempt(command, _scratch_copy(app_dir, index)).start())
+        winner = None
+        first_success = None
+        deadline = time.time() + timeout
+        while winner is None and time.time() < deadline:
+            codes = [attempt.poll() for attempt in attempts]
+            best = next((index for index, code in enumerate(codes) if code == 0), None)
+            if best is not None:
+                first_success = first_success or time.time()
+                preferred_done = all(code is not None for code in codes[:best])
+                if preferred_done or time.time() - first_success >= FALLBACK_GRACE:
+                    winner = attempts[best]
+                    break
+            elif all(code is not None for code in codes):
+                break
+            time.sleep(0.2)
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel("cancelled" if winner is not None else "timeout")
+        reports = [attempt.report() for attempt in attempts]
+        if winner is None:
+            raise InstallError(reports)
+        _adopt(winner.cwd, app_dir)
+        print(f"Dependencies installed with '{winner.command}' in {reports[attempts.index(winner)]['seconds']}s")
+        return reports[attempts.index(winner)]
+    finally:
+        for attempt in attempts:
+            attempt.cancel("cancelled")
+            shutil.rmtree(attempt.cwd, ignore_errors=True)
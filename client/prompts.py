@@ -1,4 +1,5 @@
 # This file contains all the prompts template.
+import hashlib
 from string import Template
 
 REQUIREMENT_DIVIDER_PROMPT = Template("""# ROLE
@@ -915,6 +916,47 @@ The structure must be as follows:
 }
 """)
 
+COMPILE_TEST_PROMPT = Template("""# Persona
+You are a senior test automation engineer who turns manual test scenarios into precise Playwright steps.
+
+# Objective
+Translate the soap opera test case below into a deterministic list of browser steps and assertions that a Playwright runner can execute without human judgement. You cannot see the page, so locate elements the way a user perceives them: by role and accessible name, label, placeholder or visible text.
+
+# Step Vocabulary
+Each step is a JSON object with an `op` field:
+- {"op": "goto", "path": "/"}: open a path of the application under test. Always start with this.
+- {"op": "click", "target": TARGET}
+- {"op": "fill", "target": TARGET, "text": "..."}
+- {"op": "select", "target": TARGET, "text": "visible option label"}
+- {"op": "press", "keys": "Enter"}: keyboard keys in Playwright notation.
+- {"op": "expect_visible", "target": TARGET}
+- {"op": "expect_hidden", "target": TARGET}
+- {"op": "expect_text", "target": TARGET, "text": "..."}: the element's text contains this string.
+- {"op": "expect_value", "target": TARGET, "text": "..."}: the current value of an input.
+- {"op": "expect_count", "target": TARGET, "count": 3}
+- {"op": "expect_url", "path": "/cart"}: the current path (including a #hash route, if any) ends with this.
+
+TARGET is exactly one of:
+- {"role": "button", "name": "Add to cart"} (ARIA role and accessible name; preferred)
+- {"label": "Email"}
+- {"placeholder": "Search..."}
+- {"text": "Welcome back"}
+- {"test_id": "cart-count"}
+Add "exact": true to match the name or text exactly instead of as a substring. Add "nth": N to pick the N-th (0-based) of several matches.
+
+# Rules
+1.  Cover every item in `narrative_steps`: perform its `action`, then check its `expected_outcome` with one or more expect_* steps. A test without an expect_* step per narrative step, or one that does not end with an expect_* step, is rejected.
+2.  Only assert what the test case states. Do not invent copy, counts or routes that it does not specify.
+3.  If the test case depends on visual judgement (layout, colours, images, "looks correct") or on data you cannot predict, set "compilable" to false and return an empty `steps` array.
+
+# Test Case
+$criteria
+
+# Output Format
+Return only a JSON object, without any other text:
+{"compilable": true, "steps": [...]}
+""")
+
 # Registry
 PROMPTS = {
     "REQUIREMENT_DIVIDER": REQUIREMENT_DIVIDER_PROMPT,  # kwarg: `instruction`
@@ -939,6 +981,7 @@ PROMPTS = {
     "ERROR_FEEDBACK": ERROR_FEEDBACK_PROMPT,  # kwarg: `errors`
     "TEST_CRITERIA_DEEPSEEK": TEST_CRITERIA_DEEPSEEK_PROMPT,  # kwarg: `instruction`, `requirements`
     "WEB_SOAP_TEST_DEEPSEEK": WEB_SOAP_TEST_DEEPSEEK_PROMPT,  # kwarg: `url`, `criteria`
+    "COMPILE_TEST": COMPILE_TEST_PROMPT,  # kwarg: `criteria`
 }
 
 # Factory Method Pattern for Prompts
@@ -964,3 +1007,9 @@ def get_prompt(name: str, **kwargs) -> str:
             f"Missing parameter {e} for prompt '{name}'. "
             f"Expected: {template.template}"
         )
+
+
+# Changes whenever any template text changes; part of the LLM response cache key
+PROMPT_TEMPLATE_VERSION = hashlib.sha256(
+    "\0".join(f"{name}={template.template}" for name, template in sorted(PROMPTS.items())).encode("utf-8")
+).hexdigest()[:16]
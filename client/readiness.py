@@ -0,0 +1,71 @@
+"""Readiness probes for the pm2-launched dev server instances.
+
+Replaces the warm-up agent round: each instance is polled over HTTP until its
+main route answers, then the module scripts referenced by the page (the Vite
+entry bundle) are fetched so on-demand compilation happens before any agent
+arrives, and compile errors surface as probe failures.
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+READINESS_TIMEOUT = 90
+_SCRIPT_SRC = re.compile(r"<script[^>]*\bsrc=[\"']([^\"']+)[\"']", re.IGNORECASE)
+
+
+def probe_instance(port: int, timeout: float = READINESS_TIMEOUT, prefetch: bool = True) -> dict:
+    """Poll http://localhost:<port>/ until it serves the page and its entry scripts compile."""
+    url = f"http://localhost:{port}/"
+    started = time.time()
+    report = {"port": port, "url": url, "ready": False, "status": None, "latency_seconds": None, "error": None}
+    while time.time() - started < timeout:
+        try:
+            response = requests.get(url, timeout=10)
+            report["status"] = response.status_code
+            if response.status_code >= 500:
+                report["error"] = f"GET / returned {response.status_code}: {response.text[:500]}"
+                break
+            if response.ok:
+                if prefetch:
+                    error = _prefetch_entry_scripts(url, response.text)
+                    if error:
+                        report["error"] = error
+                        break
+                report["ready"] = True
+                report["error"] = None
+                break
+            report["error"] = f"GET / returned {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            report["error"] = f"{type(e).__name__}: {e}"
+        time.sleep(0.5)
+    report["latency_seconds"] = round(time.time() - started, 2)
+    return report
+
+
+def _prefetch_entry_scripts(base_url: str, html: str) -> str | None:
+    """Fetch the page's own scripts (e.g. /src/main.tsx); Vite answers 500 when they fail to compile."""
+    for src in _SCRIPT_SRC.findall(html):
+        script_url = urljoin(base_url, src)
+        if not script_url.startswith(base_url) or "/@vite/client" in script_url:
+            continue
+        try:
+            response = requests.get(script_url, timeout=60)
+        except requests.exceptions.RequestException as e:
+            return f"Failed to fetch entry script {src}: {e}"
+        if not response.ok:
+            return f"Entry script {src} failed to compile ({response.status_code}): {response.text[:1000]}"
+    return None
+
+
+def probe_instances(ports: list[int], timeout: float = READINESS_TIMEOUT, prefetch: bool = True) -> list[dict]:
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        reports = list(executor.map(lambda port: probe_instance(port, timeout, prefetch), ports))
+    for report in reports:
+        state = "ready" if report["ready"] else f"NOT ready ({report['error']})"
+        print(f"Instance on port {report['port']} {state} after {report['latency_seconds']}s")
+    return reports
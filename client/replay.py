@@ -0,0 +1,320 @@
+"""Record-and-replay of passing browser-use runs.
+
+When an agent passes a test criterion, its history is compiled into a
+deterministic Playwright action script (navigate, click, fill, select, keys,
+scroll). Before it is stored under the criterion's hash, the script is run once
+against the same build to record what each step does to the page: the lines of
+visible text that appear or disappear after it. Those effects are the script's
+assertions. Later rounds replay the script against the new build without any
+LLM call, and it passes only if every recorded element is found, every
+navigation lands on the same route, every step has its recorded effect and the
+page raises no uncaught exception; otherwise the caller falls back to the
+agent, whose next passing run re-records the script. Scripts whose steps have
+no observable effect are not stored, since they could not tell a working
+feature from one that only renders its controls.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from playwright.async_api import async_playwright
+
+REPLAY_DIR = Path(os.environ.get("REPLAY_DIR", str(Path(__file__).resolve().parent / "cache" / "replay")))
+REPLAY_ENABLED = os.environ.get("REPLAY_TESTS", "1") != "0"
+STEP_TIMEOUT = 5.0
+MAX_WAIT_SECONDS = 3
+SCRIPT_VERSION = 2
+# Recorded effects per step and direction
+MAX_EFFECTS = 5
+MAX_LINE_LENGTH = 200
+
+# Actions that only read the page or the agent's own scratch files
+_READ_ONLY_ACTIONS = {"extract_structured_data", "get_dropdown_options", "read_file", "write_file", "replace_file_str"}
+_SELECTOR_ATTRIBUTES = ("data-testid", "data-test", "data-cy", "id", "name", "aria-label", "placeholder", "title")
+
+# Lines that change on their own (clocks, dates, relative times) are not effects of a step
+_VOLATILE = re.compile(r"\d{1,2}:\d{2}|\d{4}-\d{2}-\d{2}|\b\d+\s*(?:s|sec|seconds?|min|minutes?|hours?)\s+ago\b", re.IGNORECASE)
+_VISIBLE_LINES = """() => (document.body ? document.body.innerText : "")
+    .split("\\n").map((line) => line.replace(/\\s+/g, " ").trim()).filter(Boolean)"""
+
+stats = {"replays": 0, "passed": 0, "recorded": 0}
+_lock = threading.Lock()
+
+
+class ReplayFailure(Exception):
+    pass
+
+
+def criterion_key(criterion: str) -> str:
+    return hashlib.sha256(criterion.encode("utf-8")).hexdigest()[:32]
+
+
+def _selectors(element: dict | None) -> list[str]:
+    if not element:
+        return []
+    tag = (element.get("node_name") or element.get("tag_name") or "").lower()
+    attributes = element.get("attributes") or {}
+    selectors = []
+    for name in _SELECTOR_ATTRIBUTES:
+        value = attributes.get(name)
+        if value:
+            escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            selectors.append(f'{tag}[{name}="{escaped}"]')
+    xpath = element.get("x_path") or element.get("xpath")
+    if xpath:
+        selectors.append("xpath=" + (xpath if xpath.startswith("/") else "/" + xpath))
+    return selectors
+
+
+def _route(url: str) -> str:
+    parsed = urlparse(url)
+    return (parsed.path or "/") + (f"#{parsed.fragment}" if parsed.fragment else "")
+
+
+def compile_history(history: dict, origin: str) -> list[dict] | None:
+    """Steps replaying a dumped AgentHistoryList, or None if it used an action that cannot be replayed."""
+    steps = []
+    items = history.get("history") or []
+    for position, item in enumerate(items):
+        actions = (item.get("model_output") or {}).get("action") or []
+        elements = (item.get("state") or {}).get("interacted_element") or []
+        for index, action in enumerate(actions):
+            name, params = next(((k, v) for k, v in action.items() if v is not None), (None, None))
+            params = params or {}
+            element = elements[index] if index < len(elements) else None
+            if name is None or name == "done" or name in _READ_ONLY_ACTIONS:
+                continue
+            if name == "go_to_url":
+                if params.get("new_tab"):
+                    return None
+                steps.append({"op": "goto", "url": params["url"]})
+            elif name == "go_back":
+                steps.append({"op": "go_back"})
+            elif name == "wait":
+                steps.append({"op": "wait", "seconds": min(float(params.get("seconds", 1)), MAX_WAIT_SECONDS)})
+            elif name in ("click_element_by_index", "input_text", "select_dropdown_option"):
+                selectors = _selectors(element)
+                if not selectors:
+                    return None
+                step = {"op": {"click_element_by_index": "click", "input_text": "fill", "select_dropdown_option": "select"}[name],
+                        "selectors": selectors}
+                if name != "click_element_by_index":
+                    step["text"] = params.get("text", "")
+                steps.append(step)
+            elif name == "send_keys":
+                steps.append({"op": "press", "keys": params["keys"]})
+            elif name == "scroll":
+                steps.append({"op": "scroll", "down": params.get("down", True), "pages": float(params.get("num_pages", 1))})
+            elif name == "scroll_to_text":
+                steps.append({"op": "scroll_to_text", "text": params["text"]})
+            else:
+                return None
+        # The route the agent saw before its next step is what the replay must reach too
+        if steps and position + 1 < len(items):
+            next_url = (items[position + 1].get("state") or {}).get("url") or ""
+            if next_url.startswith(origin):
+                steps[-1]["expect_route"] = _route(next_url)
+    return steps or None
+
+
+class ReplayStore:
+    def __init__(self, directory: Path = REPLAY_DIR) -> None:
+        self.directory = Path(directory)
+
+    def _path(self, criterion: str) -> Path:
+        return self.directory / f"{criterion_key(criterion)}.json"
+
+    def get(self, criterion: str) -> dict | None:
+        if not REPLAY_ENABLED:
+            return None
+        try:
+            with open(self._path(criterion), "r", encoding="utf-8") as f:
+                script = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return script if script.get("version") == SCRIPT_VERSION else None
+
+    async def record(self, criterion: str, result, target_url: str, cdp_endpoint: str) -> bool:
+        """Compile a passing agent run (AgentHistoryList or its dump), record each step's effect on
+        the page by running it once against target_url, and store it for the criterion."""
+        if not REPLAY_ENABLED:
+            return False
+        try:
+            history = result if isinstance(result, dict) else result.model_dump()
+            origin = f"{urlparse(target_url).scheme}://{urlparse(target_url).netloc}"
+            steps = compile_history(history, origin)
+        except Exception as e:
+            print(f"Could not compile agent history for replay: {e}")
+            return False
+        if not steps:
+            return False
+        script = {"version": SCRIPT_VERSION, "criterion": criterion, "origin": origin, "steps": steps}
+        outcome = await _execute(script, target_url, cdp_endpoint, learn=True)
+        if not outcome["passed"]:
+            print(f"Agent run did not replay, not recording it: {outcome['error']}")
+            return False
+        if not _has_effects(script):
+            print("Agent run has no observable effect on the page, not recording it")
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        script["recorded_at"] = time.time()
+        tmp = self._path(criterion).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(script, f, indent=2)
+        os.replace(tmp, self._path(criterion))
+        with _lock:
+            stats["recorded"] += 1
+        return True
+
+
+def _has_effects(script: dict) -> bool:
+    return any(step.get("appears") or step.get("disappears") for step in script["steps"])
+
+
+async def _visible_lines(page) -> set[str]:
+    # Wait for requests a step triggered (e.g. a save or a search) before reading the page
+    try:
+        await page.wait_for_load_state("networkidle", timeout=2000)
+    except Exception:
+        pass
+    return {line for line in await page.evaluate(_VISIBLE_LINES) if len(line) <= MAX_LINE_LENGTH and not _VOLATILE.search(line)}
+
+
+async def _check_effects(page, step: dict):
+    appears, disappears = step.get("appears") or [], step.get("disappears") or []
+    if not appears and not disappears:
+        return
+    deadline = time.monotonic() + STEP_TIMEOUT
+    while True:
+        lines = await _visible_lines(page)
+        missing = [line for line in appears if line not in lines]
+        lingering = [line for line in disappears if line in lines]
+        if not missing and not lingering:
+            return
+        if time.monotonic() >= deadline:
+            raise ReplayFailure(f'expected "{missing[0]}" to appear' if missing else f'expected "{lingering[0]}" to disappear')
+        await asyncio.sleep(0.1)
+
+
+async def _locate(page, selectors: list[str], timeout: float = STEP_TIMEOUT):
+    """First selector matching exactly one element (else the first matching any), polled until `timeout`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        fallback = None
+        for selector in selectors:
+            try:
+                count = await page.locator(selector).count()
+            except Exception:
+                continue
+            if count == 1:
+                return page.locator(selector).first
+            if count > 1 and fallback is None:
+                fallback = page.locator(selector).first
+        if fallback is not None:
+            return fallback
+        if time.monotonic() >= deadline:
+            raise ReplayFailure(f"element not found: {selectors[0]}")
+        await asyncio.sleep(0.1)
+
+
+async def _run_step(page, step: dict, origin: str, recorded_origin: str):
+    op = step["op"]
+    timeout_ms = STEP_TIMEOUT * 1000
+    if op == "goto":
+        url = step["url"].replace(recorded_origin, origin, 1) if step["url"].startswith(recorded_origin) else step["url"]
+        await page.goto(url, wait_until="load")
+    elif op == "go_back":
+        await page.go_back()
+    elif op == "wait":
+        await asyncio.sleep(step["seconds"])
+    elif op == "click":
+        await (await _locate(page, step["selectors"])).click(timeout=timeout_ms)
+    elif op == "fill":
+        await (await _locate(page, step["selectors"])).fill(step["text"], timeout=timeout_ms)
+    elif op == "select":
+        await (await _locate(page, step["selectors"])).select_option(label=step["text"], timeout=timeout_ms)
+    elif op == "press":
+        await page.keyboard.press(step["keys"])
+    elif op == "scroll":
+        height = (page.viewport_size or {"height": 1080})["height"]
+        await page.mouse.wheel(0, height * step["pages"] * (1 if step["down"] else -1))
+    elif op == "scroll_to_text":
+        await page.get_by_text(step["text"]).first.scroll_into_view_if_needed(timeout=timeout_ms)
+
+    if "expect_route" in step:
+        deadline = time.monotonic() + STEP_TIMEOUT
+        while _route(page.url) != step["expect_route"]:
+            if time.monotonic() >= deadline:
+                raise ReplayFailure(f"expected route {step['expect_route']} after {op}, got {_route(page.url)}")
+            await asyncio.sleep(0.1)
+
+
+async def _execute(script: dict, target_url: str, cdp_endpoint: str, learn: bool = False) -> dict:
+    """Run `script` against target_url in a fresh context of the browser at `cdp_endpoint`.
+
+    With `learn`, each step's effect (visible lines added and removed) is stored on the step
+    instead of being checked."""
+    started = time.monotonic()
+    origin = f"{urlparse(target_url).scheme}://{urlparse(target_url).netloc}"
+    outcome = {"passed": False, "error": None, "seconds": None, "steps": len(script["steps"])}
+    page_errors = []
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.connect_over_cdp(cdp_endpoint)
+            context = await browser.new_context(viewport={"width": 1280, "height": 1080})
+            try:
+                page = await context.new_page()
+                page.on("pageerror", lambda error: page_errors.append(str(error)))
+                await page.goto(target_url, wait_until="load")
+                before = await _visible_lines(page) if learn else None
+                for number, step in enumerate(script["steps"], 1):
+                    try:
+                        await _run_step(page, step, origin, script["origin"])
+                        if learn:
+                            after = await _visible_lines(page)
+                            step["appears"] = sorted(after - before)[:MAX_EFFECTS]
+                            step["disappears"] = sorted(before - after)[:MAX_EFFECTS]
+                            before = after
+                        else:
+                            await _check_effects(page, step)
+                    except ReplayFailure as e:
+                        raise ReplayFailure(f"step {number} ({step['op']}): {e}")
+                    except Exception as e:
+                        raise ReplayFailure(f"step {number} ({step['op']}): {str(e).splitlines()[0]}")
+                    if page_errors:
+                        raise ReplayFailure(f"uncaught exception after step {number}: {page_errors[0][:500]}")
+                outcome["passed"] = True
+            finally:
+                await context.close()
+    except ReplayFailure as e:
+        outcome["error"] = str(e)
+    except Exception as e:
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    outcome["seconds"] = round(time.monotonic() - started, 2)
+    return outcome
+
+
+async def replay(script: dict, target_url: str, cdp_endpoint: str) -> dict:
+    """Replay a recorded script; it passes only if every step reproduces its recorded effect."""
+    if not _has_effects(script):
+        outcome = {"passed": False, "error": "script records no effects to check", "seconds": 0.0, "steps": len(script["steps"])}
+    else:
+        outcome = await _execute(script, target_url, cdp_endpoint)
+    with _lock:
+        stats["replays"] += 1
+        stats["passed"] += outcome["passed"]
+    return outcome
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
+
+
+replay_store = ReplayStore()
@@ -0,0 +1,114 @@
+"""Retry policy for LLM calls: classified errors, jittered exponential backoff,
+provider Retry-After headers, a per-call deadline and a maximum attempt count.
+
+`fn` receives the seconds left until the deadline and is expected to use them
+as its request timeout, so a single hung attempt cannot outlive the deadline."""
+import asyncio
+import email.utils
+import os
+import random
+import time
+
+import openai
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+
+class EmptyCompletionError(Exception):
+    """The provider answered without any content (no choices, or a None message)."""
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=None, base_delay=2.0, max_delay=60.0, deadline=None) -> None:
+        self.max_attempts = max_attempts or int(os.environ.get("LLM_MAX_ATTEMPTS", "6"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline or float(os.environ.get("LLM_CALL_DEADLINE", "600"))
+
+    def is_retryable(self, e):
+        # Bad keys, unknown models and malformed requests will fail the same way again
+        if isinstance(e, (openai.AuthenticationError, openai.PermissionDeniedError,
+                          openai.NotFoundError, openai.BadRequestError, openai.UnprocessableEntityError)):
+            return False
+        if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+            return True
+        if isinstance(e, openai.APIStatusError):
+            return e.status_code in RETRYABLE_STATUS
+        # Empty completions are worth another try; any other exception is a bug to surface
+        return isinstance(e, EmptyCompletionError)
+
+    def retry_after(self, e):
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def next_delay(self, e, attempt, started):
+        """Seconds to wait before the next attempt, or None to give up and re-raise."""
+        if not self.is_retryable(e) or attempt >= self.max_attempts:
+            return None
+        delay = self.retry_after(e)
+        if delay is None:
+            delay = self.backoff(attempt)
+        remaining = self.deadline - (time.monotonic() - started)
+        if delay >= remaining:
+            return None
+        return delay
+
+    def remaining(self, started):
+        return max(1.0, self.deadline - (time.monotonic() - started))
+
+    def call(self, fn, on_error=None):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn(self.remaining(started))
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                delay = self.next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                print(f"Retry {attempt}/{self.max_attempts - 1} after {delay:.1f}s")
+                time.sleep(delay)
+
+    async def acall(self, fn, on_error=None):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn(self.remaining(started))
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                delay = self.next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                print(f"Retry {attempt}/{self.max_attempts - 1} after {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+default_policy = RetryPolicy()
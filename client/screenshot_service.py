@@ -0,0 +1,135 @@
+"""Screenshot service on one long-lived async Playwright browser.
+
+The browser runs on a dedicated event loop thread and is started once; every
+capture gets its own isolated context, so several URLs or viewports can be
+shot concurrently. Images come straight from CDP's Page.captureScreenshot,
+which downscales (clip scale), caps tall pages and encodes to PNG/JPEG/WebP at
+a configurable quality, keeping vision payloads small.
+"""
+import asyncio
+import atexit
+import os
+import threading
+import time
+
+from playwright.async_api import async_playwright
+
+import load_check
+
+SCREENSHOT_FORMAT = os.environ.get("SCREENSHOT_FORMAT", "webp")  # png | jpeg | webp
+SCREENSHOT_QUALITY = int(os.environ.get("SCREENSHOT_QUALITY", "80"))
+# Width of the encoded image; the page is still laid out at the viewport width
+SCREENSHOT_WIDTH = int(os.environ.get("SCREENSHOT_WIDTH", "1280"))
+# Tall pages are cut off beyond this many CSS pixels
+SCREENSHOT_MAX_HEIGHT = int(os.environ.get("SCREENSHOT_MAX_HEIGHT", "4320"))
+DEFAULT_VIEWPORT = {"width": 1920, "height": 1080}
+CAPTURE_TIMEOUT = 90
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class ScreenshotService:
+    def __init__(self) -> None:
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._start_lock = threading.Lock()
+        self._browser_lock = None
+        self.captures = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._browser_lock = asyncio.Lock()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="screenshot-service", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _get_browser(self):
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                print("Screenshot service browser started")
+            return self._browser
+
+    async def _shoot(self, cdp, width: int, top: int, height: int, fmt: str, quality: int) -> str:
+        params = {
+            "format": fmt,
+            "clip": {"x": 0, "y": top, "width": width, "height": height, "scale": min(1.0, SCREENSHOT_WIDTH / width)},
+            "captureBeyondViewport": True,
+        }
+        if fmt != "png":
+            params["quality"] = quality
+        return (await cdp.send("Page.captureScreenshot", params))["data"]
+
+    async def acapture(self, url: str, viewport: dict | None = None, fmt: str | None = None,
+                       quality: int | None = None, max_height: int | None = None, png_copy: bool = False) -> dict:
+        """Load `url` in a fresh context and return its screenshot plus load signals.
+
+        Pages taller than `max_height` CSS pixels are cut off. With `png_copy`, the same
+        clip is also encoded as PNG into `png` (for saving to disk). Navigation failures
+        are reported in the signals and leave `images` empty."""
+        viewport = viewport or DEFAULT_VIEWPORT
+        fmt = fmt or SCREENSHOT_FORMAT
+        quality = quality or SCREENSHOT_QUALITY
+        max_height = max_height or SCREENSHOT_MAX_HEIGHT
+        started = time.time()
+        shot = {"url": url, "format": fmt, "mime": MIME_TYPES[fmt], "viewport": viewport,
+                "images": [], "png": None, "page_height": None, "truncated": False, "signals": load_check.new_signals(url)}
+        signals = shot["signals"]
+
+        browser = await self._get_browser()
+        context = await browser.new_context(viewport=viewport)
+        try:
+            page = await context.new_page()
+            load_check.attach(page, signals)
+            try:
+                response = await page.goto(url, wait_until="networkidle")
+            except Exception as e:
+                signals["navigation_error"] = str(e).splitlines()[0]
+                return shot
+            signals["http_status"] = response.status if response else None
+
+            cdp = await context.new_cdp_session(page)
+            metrics = await cdp.send("Page.getLayoutMetrics")
+            page_height = int(metrics["cssContentSize"]["height"])
+            shot["page_height"] = page_height
+            height = max(1, min(page_height, max_height))
+            shot["truncated"] = page_height > height
+            shot["images"].append(await self._shoot(cdp, viewport["width"], 0, height, fmt, quality))
+            if png_copy:
+                shot["png"] = shot["images"][0] if fmt == "png" else await self._shoot(cdp, viewport["width"], 0, height, "png", quality)
+            await load_check.inspect(page, signals, shot["images"][0], shot["mime"])
+        finally:
+            await context.close()
+            self.captures += 1
+            shot["seconds"] = round(time.time() - started, 2)
+        return shot
+
+    def capture(self, url: str, **options) -> dict:
+        """Blocking wrapper for callers outside the service loop (e.g. Flask handlers)."""
+        future = asyncio.run_coroutine_threadsafe(self.acapture(url, **options), self._ensure_loop())
+        return future.result(timeout=CAPTURE_TIMEOUT)
+
+    def shutdown(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            if self._browser is not None:
+                await self._browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+        try:
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=10)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+screenshot_service = ScreenshotService()
+atexit.register(screenshot_service.shutdown)
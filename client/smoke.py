@@ -0,0 +1,180 @@
+"""Tiered smoke checks run before the browser-use agents.
+
+Each criterion's static_description (the default, non-interactive appearance
+of the feature) is turned into cheap DOM assertions without an LLM: quoted
+strings become text, placeholder or control (button/link) checks, and routes
+it names must render. One snapshot per route is taken with plain Playwright,
+routes spread over all running instances, and every criterion is checked
+against those snapshots. A route that does not render is a final failure.
+Missing text or controls are only evidence: the description is prose and may
+name copy loosely or content that appears after interaction, so those criteria
+still go to the agent tier, which decides, and the evidence is attached if the
+agent fails them too.
+"""
+import asyncio
+import os
+import re
+import time
+from urllib.parse import urljoin
+
+from playwright.async_api import async_playwright
+
+SMOKE_CHECKS = os.environ.get("SMOKE_CHECKS", "1") != "0"
+SMOKE_TIMEOUT_MS = int(os.environ.get("SMOKE_TIMEOUT_MS", "10000"))
+# Longer quotes are sample prose rather than text the page must show verbatim
+MAX_QUOTE_LENGTH = 60
+
+_QUOTED = re.compile(r"\"([^\"\n]+)\"|“([^”\n]+)”|‘([^’\n]+)’|(?<!\w)'([^'\n]+)'(?!\w)|`([^`\n]+)`")
+_ROUTE = re.compile(r"\b(?:route|path|url|page at)\s+[`'\"“‘]?(/[\w\-/]*)")
+_IDENTIFIER = re.compile(r"^[a-z0-9]+(?:[_\-.][a-z0-9]+)+$|^[a-z]+[A-Z]\w*$")
+_CONTROL_WORDS = {"button": "button", "buttons": "button", "link": "link", "links": "link", "tab": "button", "tabs": "button"}
+
+_SNAPSHOT = """() => {
+    const norm = (s) => (s || "").replace(/\\s+/g, " ").trim().toLowerCase();
+    const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    const controls = [];
+    for (const el of document.querySelectorAll("body *")) {
+        if (!visible(el)) continue;
+        const tag = el.tagName.toLowerCase();
+        const role = el.getAttribute("role");
+        let kind = null;
+        if (tag === "button" || role === "button" || role === "tab" || (tag === "input" && ["button", "submit", "reset"].includes(el.type))) kind = "button";
+        else if ((tag === "a" && el.hasAttribute("href")) || role === "link") kind = "link";
+        else if (getComputedStyle(el).cursor === "pointer") kind = "clickable";
+        if (kind) controls.push([kind, norm(el.getAttribute("aria-label") || el.innerText || el.value || el.title)]);
+    }
+    const attributes = [];
+    for (const el of document.querySelectorAll("[placeholder], [aria-label], [title], [alt], input[value], option")) {
+        for (const name of ["placeholder", "aria-label", "title", "alt", "value"]) {
+            if (el.getAttribute(name)) attributes.push(norm(el.getAttribute(name)));
+        }
+        if (el.tagName === "OPTION") attributes.push(norm(el.textContent));
+    }
+    const root = document.querySelector("#root, #app, #__next");
+    return {
+        text: norm(document.body ? document.body.innerText : ""),
+        title: norm(document.title),
+        placeholders: [...document.querySelectorAll("[placeholder]")].map((el) => norm(el.getAttribute("placeholder"))),
+        attributes,
+        controls,
+        rendered: !document.querySelector("vite-error-overlay") && !(root && root.childElementCount === 0),
+    };
+}"""
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def plan(static_description: str | None, ignore=()) -> list[dict]:
+    """DOM assertions implied by a static_description; empty when it names nothing checkable.
+
+    `ignore` holds strings that are not page text (e.g. resource_dependency keys)."""
+    if not static_description:
+        return []
+    ignored = {_normalize(name) for name in ignore}
+    checks, seen = [], set()
+    for route in _ROUTE.findall(static_description):
+        route = route.rstrip("/") or "/"
+        if ("route", route) not in seen:
+            seen.add(("route", route))
+            checks.append({"kind": "route", "route": route})
+    for match in _QUOTED.finditer(static_description):
+        value = next(group for group in match.groups() if group is not None).strip()
+        text = _normalize(value)
+        if (len(text) > MAX_QUOTE_LENGTH or sum(c.isalnum() for c in text) < 2 or text in ignored
+                or value.startswith(("/", "#", "http")) or _IDENTIFIER.match(value)):
+            continue
+        before = static_description[max(0, match.start() - 40):match.start()].lower().split()[-3:]
+        after = static_description[match.end():match.end() + 20].lower().split()[:2]
+        words = [w.strip(".,;:()") for w in before + after]
+        if "placeholder" in words:
+            check = {"kind": "placeholder", "text": text}
+        elif any(w in _CONTROL_WORDS for w in words):
+            check = {"kind": "control", "role": next(_CONTROL_WORDS[w] for w in words if w in _CONTROL_WORDS), "text": text}
+        else:
+            check = {"kind": "text", "text": text}
+        key = tuple(sorted(check.items()))
+        if key not in seen:
+            seen.add(key)
+            checks.append(check)
+    return checks
+
+
+def _holds(check: dict, snapshot: dict) -> bool:
+    if check["kind"] == "text":
+        return check["text"] in snapshot["text"] or check["text"] in snapshot["title"] or any(check["text"] in a for a in snapshot["attributes"])
+    if check["kind"] == "placeholder":
+        return any(check["text"] in p for p in snapshot["placeholders"])
+    # A described button may be a link or a clickable element in the implementation, and vice versa
+    return any(check["text"] in name for _, name in snapshot["controls"])
+
+
+def _describe(check: dict) -> str:
+    if check["kind"] == "route":
+        return f"route {check['route']} does not render"
+    if check["kind"] == "placeholder":
+        return f"no input with placeholder \"{check['text']}\""
+    if check["kind"] == "control":
+        return f"no {check['role']} labelled \"{check['text']}\""
+    return f"text \"{check['text']}\" not shown"
+
+
+async def _snapshot(context, url: str) -> dict | None:
+    page = await context.new_page()
+    try:
+        await page.goto(url, wait_until="load", timeout=SMOKE_TIMEOUT_MS)
+        try:
+            await page.wait_for_load_state("networkidle", timeout=2000)
+        except Exception:
+            pass
+        return await page.evaluate(_SNAPSHOT)
+    except Exception as e:
+        print(f"Smoke snapshot of {url} failed: {str(e).splitlines()[0]}")
+        return None
+    finally:
+        await page.close()
+
+
+async def run(plans: list[list[dict]], instance_urls: list[str], cdp_endpoint: str) -> dict:
+    """Check every plan against snapshots of the routes they need.
+
+    Returns {index: {"evidence": str, "final": bool}} for the criteria that failed, final
+    only when a route they name does not render; criteria with an empty plan, and all
+    criteria when no snapshot could be taken, are left to the agents."""
+    started = time.monotonic()
+    routes = ["/"] + sorted({c["route"] for checks in plans for c in checks if c["kind"] == "route"} - {"/"})
+    async with async_playwright() as p:
+        browser = await p.chromium.connect_over_cdp(cdp_endpoint)
+        context = await browser.new_context(viewport={"width": 1280, "height": 1080})
+        try:
+            snapshots = await asyncio.gather(*(
+                _snapshot(context, urljoin(instance_urls[i % len(instance_urls)], route))
+                for i, route in enumerate(routes)
+            ))
+        finally:
+            await context.close()
+    by_route = dict(zip(routes, snapshots))
+    if by_route["/"] is None:
+        return {}
+    rendered = [s for s in snapshots if s is not None and s["rendered"]]
+
+    failures = {}
+    for index, checks in enumerate(plans):
+        missing, final = [], False
+        for check in checks:
+            if check["kind"] == "route":
+                snapshot = by_route.get(check["route"])
+                ok = snapshot is not None and snapshot["rendered"]
+            else:
+                # Static content may live on any of the app's routes
+                ok = any(_holds(check, snapshot) for snapshot in rendered)
+            if not ok:
+                missing.append(_describe(check))
+                final = final or check["kind"] == "route"
+        if missing:
+            failures[index] = {"evidence": f"Smoke check failed ({', '.join(routes)} inspected): " + "; ".join(missing), "final": final}
+    final_count = sum(failure["final"] for failure in failures.values())
+    print(f"Smoke checks: {len(failures)}/{len(plans)} criteria failed on {len(routes)} route(s) ({final_count} final) "
+          f"in {time.monotonic() - started:.2f}s")
+    return failures
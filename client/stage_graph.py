@@ -0,0 +1,95 @@
+"""Dependency-graph scheduler for pipeline stages.
+
+Each stage runs on a worker thread as soon as all of its dependencies have
+finished, so independent stages (e.g. dispatching code generation and
+deriving test criteria) overlap instead of running strictly in sequence.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StageError(Exception):
+    """Raised by a stage to fail with a message meant for the caller."""
+
+
+class StageGraph:
+    def __init__(self, name="pipeline", max_workers=4) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self._stages = {}
+        self._order = []
+        self._results = {}
+        self._errors = {}
+        self._done = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def add(self, name, fn, deps=()):
+        """Register `fn(results)`; `results` maps each dependency name to its return value."""
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = (fn, tuple(deps))
+        self._order.append(name)
+        self._done[name] = threading.Event()
+        return self
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self._schedule_ready()
+        return self
+
+    def _schedule_ready(self):
+        with self._lock:
+            progress = True
+            while progress:
+                progress = False
+                for name in self._order:
+                    if name in self._timings:
+                        continue
+                    _, deps = self._stages[name]
+                    if not all(self._done[dep].is_set() for dep in deps):
+                        continue
+                    self._timings[name] = {"start": time.monotonic(), "end": None}
+                    failed = [dep for dep in deps if dep in self._errors]
+                    if failed:
+                        # Skip: dependents of a failed stage fail with the same error
+                        self._errors[name] = self._errors[failed[0]]
+                        self._timings[name]["end"] = self._timings[name]["start"]
+                        self._done[name].set()
+                        progress = True
+                        continue
+                    self._executor.submit(self._run, name)
+            if all(event.is_set() for event in self._done.values()):
+                self._executor.shutdown(wait=False)
+
+    def _run(self, name):
+        fn, deps = self._stages[name]
+        try:
+            self._results[name] = fn({dep: self._results[dep] for dep in deps})
+        except Exception as e:
+            print(f"Stage '{name}' failed: {e}")
+            self._errors[name] = e
+        finally:
+            self._timings[name]["end"] = time.monotonic()
+            self._done[name].set()
+            self._schedule_ready()
+
+    def result(self, name, timeout=None):
+        """Block until `name` finishes; re-raise its (or its failed dependency's) error."""
+        if not self._done[name].wait(timeout):
+            raise StageError(f"Stage '{name}' did not finish within {timeout}s")
+        if name in self._errors:
+            raise self._errors[name]
+        return self._results[name]
+
+    def done(self, name):
+        return self._done[name].is_set()
+
+    def timings(self):
+        return {
+            name: round(t["end"] - t["start"], 2) if t["end"] is not None else None
+            for name, t in self._timings.items()
+        }
@@ -0,0 +1,107 @@
+"""Build-once static serving for front-end-only apps.
+
+Instead of one `npm run dev` per parallel agent, a Vite app without a server
+side is built once and its output is served by a single in-process static
+server that every agent shares (each agent still drives its own isolated
+browser from the pool). Apps with a backend keep using dev servers.
+"""
+import json
+import os
+import subprocess
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+STATIC_SERVE = os.environ.get("STATIC_SERVE", "1") != "0"
+BUILD_TIMEOUT = int(os.environ.get("STATIC_BUILD_TIMEOUT", "600"))
+BUILD_DIR = ".tddev_dist"
+
+# Dependencies and folders that mean the app needs its own server process
+_SERVER_PACKAGES = {
+    "express", "koa", "fastify", "hono", "@nestjs/core", "socket.io", "json-server", "concurrently",
+    "next", "nuxt", "@remix-run/node", "@sveltejs/kit", "astro",
+    "prisma", "@prisma/client", "mongoose", "mongodb", "pg", "mysql2", "sqlite3", "better-sqlite3",
+}
+_SERVER_DIRS = ("server", "backend", "api")
+
+
+def is_frontend_only(app_dir) -> bool:
+    app_dir = Path(app_dir)
+    try:
+        with open(app_dir / "package.json", "r", encoding="utf-8") as f:
+            package = json.load(f)
+    except Exception:
+        return False
+    deps = {**package.get("dependencies", {}), **package.get("devDependencies", {})}
+    if "vite" not in deps or "vite" not in package.get("scripts", {}).get("dev", ""):
+        return False
+    if _SERVER_PACKAGES & deps.keys():
+        return False
+    return not any((app_dir / name).is_dir() for name in _SERVER_DIRS)
+
+
+def build_command(out_dir, sourcemap: bool = False) -> list[str]:
+    # Call vite directly: a `tsc && vite build` script would fail on type errors the dev server tolerates
+    command = ["npx", "--no-install", "vite", "build", "--outDir", str(out_dir), "--emptyOutDir"]
+    # Served builds keep sourcemaps so test selection can map bundle chunks back to source files
+    return command + ["--sourcemap"] if sourcemap else command
+
+
+def build(app_dir, timeout: int = BUILD_TIMEOUT) -> Path:
+    """Production-build the app into BUILD_DIR; raises with the build output on failure."""
+    out_dir = Path(app_dir) / BUILD_DIR
+    proc = subprocess.run(build_command(BUILD_DIR, sourcemap=True), cwd=str(app_dir), capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"vite build failed:\n{(proc.stdout + proc.stderr)[-4000:]}")
+    if not (out_dir / "index.html").is_file():
+        raise RuntimeError(f"vite build produced no index.html in {BUILD_DIR}")
+    return out_dir
+
+
+class _SpaHandler(SimpleHTTPRequestHandler):
+    def send_head(self):
+        # Client-side routes have no file on disk; answer them with index.html
+        path = Path(self.translate_path(self.path))
+        if not path.exists() and not Path(self.path.split("?", 1)[0]).suffix:
+            self.path = "/index.html"
+        return super().send_head()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StaticServer:
+    def __init__(self) -> None:
+        self.root = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self) -> int | None:
+        return self._server.server_address[1] if self._server else None
+
+    def serve(self, root) -> int:
+        """Serve `root` (reusing the running server when the directory is the same); returns the port."""
+        root = str(root)
+        if self._server is not None and self.root == root:
+            return self.port
+        self.stop()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_SpaHandler, directory=root))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="static-serve", daemon=True)
+        self._thread.start()
+        self.root = root
+        print(f"Serving static build {root} on port {self.port}")
+        return self.port
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self._server = None
+        self._thread = None
+        self.root = None
+
+
+static_server = StaticServer()
@@ -0,0 +1,244 @@
+"""Regression-test selection from round-to-round archive diffs.
+
+The index maps every test criterion to what it exercised: the routes its
+trace visited (agent history, replay script or compiled test), the source
+files the browser fetched on those routes, and the components React rendered
+there (from its dev-mode debug sources). Dev servers serve source modules
+under their own paths; a static build serves hashed chunks, which are mapped
+back to the sources bundled into them through their sourcemaps. Each
+round's archive is diffed against the last tested one by CRC; a criterion is
+re-run when it failed last time, has no footprint yet, or one of its files
+changed. Changes to files no footprint contains (package.json, configs,
+server code, index.html, ...) cannot be attributed and trigger a full run.
+Skipped criteria carry their last verdict forward.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from urllib.parse import urljoin, urlparse
+
+from playwright.async_api import async_playwright
+
+TEST_SELECTION = os.environ.get("TEST_SELECTION", "1") != "0"
+CRAWL_TIMEOUT_MS = 15000
+
+# Never loaded by the app, so changing them cannot affect a test
+_INERT = re.compile(r"(^|/)(README|CHANGELOG|LICENSE)[^/]*$|\.md$|^\.gitignore$|^\.bolt/")
+_TOOLING_PREFIXES = ("/@vite/", "/@react-refresh", "/@id/", "/node_modules/")
+
+_DEBUG_SOURCES = """() => {
+    const files = new Set();
+    for (const el of document.querySelectorAll("body *")) {
+        const key = Object.keys(el).find((k) => k.startsWith("__reactFiber$"));
+        for (let fiber = key && el[key]; fiber; fiber = fiber.return) {
+            if (fiber._debugSource && fiber._debugSource.fileName) files.add(fiber._debugSource.fileName);
+        }
+    }
+    return [...files];
+}"""
+
+stats = {"selected": 0, "skipped": 0, "full_runs": 0}
+_lock = threading.Lock()
+
+
+def archive_manifest(zip_path) -> dict:
+    """{name: "crc:size"} for the archive's files, read from the central directory without decompressing."""
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        return {info.filename: f"{info.CRC:08x}:{info.file_size}" for info in zf.infolist() if not info.is_dir()}
+
+
+def _route(url: str) -> str:
+    parsed = urlparse(url)
+    return (parsed.path or "/") + (f"#{parsed.fragment}" if parsed.fragment else "")
+
+
+def routes_from_agent(result, origin: str) -> list[str]:
+    try:
+        urls = result.urls()
+    except Exception:
+        return []
+    return [_route(url) for url in urls if url and url.startswith(origin)]
+
+
+def routes_from_replay(script: dict) -> list[str]:
+    routes = []
+    for step in script["steps"]:
+        if step["op"] == "goto" and step["url"].startswith(script["origin"]):
+            routes.append(_route(step["url"]))
+        if "expect_route" in step:
+            routes.append(step["expect_route"])
+    return routes
+
+
+def routes_from_compiled(test: dict) -> list[str]:
+    return [step["path"] for step in test["steps"] if step["op"] in ("goto", "expect_url") and str(step.get("path", "")).startswith("/")]
+
+
+def _source_file(url: str, origin: str, app_dir: str) -> str | None:
+    """Project-relative file a dev-server module URL was served from, if any."""
+    if not url.startswith(origin):
+        return None
+    path = urlparse(url).path
+    if path.startswith(_TOOLING_PREFIXES) or path == "/":
+        return None
+    if path.startswith("/@fs/"):
+        absolute = path[len("/@fs"):]
+        prefix = app_dir.rstrip("/") + "/"
+        return absolute[len(prefix):] if absolute.startswith(prefix) else None
+    return path.lstrip("/")
+
+
+def bundle_sources(name: str, bundle_dir: str, app_dir: str) -> list[str] | None:
+    """Project-relative sources bundled into the built asset `name`, from its sourcemap."""
+    asset = os.path.join(bundle_dir, name)
+    try:
+        with open(asset + ".map", "r", encoding="utf-8") as f:
+            sourcemap = json.load(f)
+    except (OSError, ValueError):
+        return None
+    base = os.path.join(os.path.dirname(asset), sourcemap.get("sourceRoot") or "")
+    sources = []
+    for source in sourcemap.get("sources") or []:
+        # Virtual modules and dependencies are not part of the archive
+        if source.startswith("\0") or "node_modules/" in source:
+            continue
+        relative = os.path.relpath(os.path.normpath(os.path.join(base, source)), app_dir)
+        if not relative.startswith(".."):
+            sources.append(relative.replace(os.sep, "/"))
+    return sources
+
+
+async def crawl(routes, base_url: str, app_dir, cdp_endpoint: str, bundle_dir=None) -> dict:
+    """{route: {"files": [...], "components": [...]}} from loading each route in a fresh page.
+
+    `bundle_dir` is the static build base_url serves, if any."""
+    origin = f"{urlparse(base_url).scheme}://{urlparse(base_url).netloc}"
+    app_dir = str(app_dir)
+    bundled = {}
+
+    def sources(name):
+        if bundle_dir is None or name is None:
+            return None
+        if name not in bundled:
+            bundled[name] = bundle_sources(name, str(bundle_dir), app_dir)
+        return bundled[name]
+
+    async def visit(context, route):
+        files = set()
+
+        def on_request(req):
+            if req.resource_type != "document":
+                name = _source_file(req.url, origin, app_dir)
+                files.update(sources(name) or [name])
+
+        page = await context.new_page()
+        page.on("request", on_request)
+        components = []
+        try:
+            await page.goto(urljoin(base_url, route), wait_until="load", timeout=CRAWL_TIMEOUT_MS)
+            try:
+                await page.wait_for_load_state("networkidle", timeout=3000)
+            except Exception:
+                pass
+            components = [_source_file(origin + "/@fs" + f, origin, app_dir) or f for f in await page.evaluate(_DEBUG_SOURCES)]
+        except Exception as e:
+            print(f"Footprint crawl of {route} failed: {str(e).splitlines()[0]}")
+            return route, None
+        finally:
+            await page.close()
+        files.discard(None)
+        return route, {"files": sorted(files), "components": sorted(components)}
+
+    async with async_playwright() as p:
+        browser = await p.chromium.connect_over_cdp(cdp_endpoint)
+        # One context per route: a shared HTTP cache would hide modules another route already fetched
+        contexts = [await browser.new_context() for _ in routes]
+        try:
+            visited = await asyncio.gather(*(visit(context, route) for context, route in zip(contexts, routes)))
+        finally:
+            for context in contexts:
+                await context.close()
+    return {route: footprint for route, footprint in visited if footprint is not None}
+
+
+class ImpactIndex:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.tested_manifest = None
+        self.pending_manifest = None
+        self.entries = {}
+
+    def begin_round(self, zip_path) -> list[str] | None:
+        """Files changed since the last tested round, or None when there is nothing to compare with."""
+        self.pending_manifest = archive_manifest(zip_path)
+        if self.tested_manifest is None:
+            return None
+        names = set(self.tested_manifest) | set(self.pending_manifest)
+        return sorted(n for n in names if self.tested_manifest.get(n) != self.pending_manifest.get(n))
+
+    def select(self, criteria: list[str], changed: list[str] | None, force: bool = False) -> tuple[list[int], dict]:
+        """(indices to run, {skipped index: carried verdict})."""
+        everything = list(range(len(criteria)))
+        if force or changed is None:
+            return everything, {}
+        changed = [name for name in changed if not _INERT.search(name)]
+        known = set().union(*(entry["files"] for entry in self.entries.values() if entry.get("files")))
+        unattributed = [name for name in changed if name not in known]
+        if unattributed:
+            print(f"Test selection: full run, changes outside every test footprint: {', '.join(unattributed[:5])}")
+            with _lock:
+                stats["full_runs"] += 1
+            return everything, {}
+
+        selected, carried = [], {}
+        for index, criterion in enumerate(criteria):
+            entry = self.entries.get(criterion)
+            if entry is None or entry["verdict"] != "Success" or not entry.get("files") or set(changed) & set(entry["files"]):
+                selected.append(index)
+            else:
+                carried[index] = entry["verdict"]
+        print(f"Test selection: {len(changed)} changed file(s), running {len(selected)}, carrying {len(carried)} verdict(s) forward")
+        with _lock:
+            stats["selected"] += len(selected)
+            stats["skipped"] += len(carried)
+        return selected, carried
+
+    def _archive_name(self, name: str) -> str:
+        # Vite serves public/ at the site root
+        manifest = self.pending_manifest or {}
+        return f"public/{name}" if name not in manifest and f"public/{name}" in manifest else name
+
+    def finish_round(self, verdicts: dict, routes: dict, footprints: dict):
+        """Record this round's verdicts ({criterion: verdict}) and, for criteria whose routes are
+        known, the files and components those routes touched."""
+        for criterion, verdict in verdicts.items():
+            entry = self.entries.setdefault(criterion, {"verdict": None, "routes": [], "files": [], "components": []})
+            entry["verdict"] = verdict
+            entry["updated_at"] = time.time()
+            visited = routes.get(criterion)
+            if not visited:
+                continue
+            traced = [footprints[route] for route in visited if route in footprints]
+            if len(traced) < len(visited):
+                # An unmapped route would make the footprint too small to trust
+                entry.update({"routes": visited, "files": [], "components": []})
+                continue
+            entry["routes"] = visited
+            entry["files"] = sorted({self._archive_name(name) for f in traced for name in f["files"]})
+            entry["components"] = sorted(set().union(*(f["components"] for f in traced)))
+        if self.pending_manifest is not None:
+            self.tested_manifest = self.pending_manifest
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**stats, "indexed": len(impact_index.entries)}
+
+
+impact_index = ImpactIndex()
@@ -0,0 +1,110 @@
+"""Persistent workspace that is updated in place between validation rounds.
+
+Instead of extracting every round's export into a fresh folder, the archive is
+diffed against the manifest recorded for the previous round and only files
+whose content changed are written (or removed), so dev servers that are kept
+running pick the edits up through Vite HMR. Changes to package.json, a
+lockfile or tooling config are flagged so the caller knows a restart is
+needed. Lockfiles npm writes on install are local-only unless the archive
+ships one: sync leaves them in place, and shipped_files() lets the
+dependency cache key ignore them.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import zipfile
+from pathlib import Path, PurePosixPath
+
+WORKSPACE_ROOT = Path(os.environ.get("WORKSPACE_ROOT", str(Path.home() / "Downloads" / ".tddev_workspaces")))
+MANIFEST_NAME = ".tddev_manifest.json"
+
+# Created in the workspace by the client itself (installs, static builds, pm2 config, this
+# manifest); never taken from the archive or removed because it is missing from it
+_LOCAL_ONLY = re.compile(r"^(node_modules|\.tddev_dist)/|^(ecosystem\.config\.cjs|\.tddev_manifest\.json)$")
+# Root-level files a running dev server does not hot-reload
+_RESTART_FILES = re.compile(
+    r"^(package\.json|package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|\.npmrc|\.env(\..+)?|tsconfig(\..+)?\.json"
+    r"|(vite|vitest|postcss|tailwind|svelte|next|nuxt|astro|remix|webpack)\.config\.[cm]?[jt]s)$"
+)
+
+
+def shipped_files(path) -> set[str] | None:
+    """Names the last synced archive put in the workspace at `path`, or None if it is not a workspace."""
+    try:
+        with open(Path(path) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def _is_safe(name: str) -> bool:
+    path = PurePosixPath(name)
+    return not path.is_absolute() and ".." not in path.parts
+
+
+class Workspace:
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.syncs = 0
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.path / MANIFEST_NAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest: dict):
+        with open(self.path / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+    def _write(self, name: str, data: bytes):
+        target = self.path / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Replace atomically so the file watcher never sees a half-written module
+        staging = self.path.parent / f".{self.path.name}.staging"
+        staging.write_bytes(data)
+        os.replace(staging, target)
+
+    def _remove(self, name: str):
+        target = self.path / name
+        target.unlink(missing_ok=True)
+        parent = target.parent
+        while parent != self.path and parent.is_dir() and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+
+    def sync(self, zip_path) -> dict:
+        """Bring the workspace in line with `zip_path`, touching only files that differ."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        previous = self._load_manifest()
+        current = {}
+        written = []
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or not _is_safe(name) or _LOCAL_ONLY.match(name):
+                    continue
+                data = zf.read(info)
+                digest = hashlib.sha256(data).hexdigest()
+                current[name] = digest
+                if previous.get(name) == digest and (self.path / name).is_file():
+                    continue
+                self._write(name, data)
+                written.append(name)
+        removed = [name for name in previous if name not in current]
+        for name in removed:
+            self._remove(name)
+        self._save_manifest(current)
+        self.syncs += 1
+
+        changed = written + removed
+        restart = not previous or any(_RESTART_FILES.match(name) for name in changed)
+        print(f"Workspace {self.path.name}: {len(written)} written, {len(removed)} removed, "
+              f"{len(current) - len(written)} unchanged{' (restart needed)' if restart else ''}")
+        return {"written": written, "removed": removed, "unchanged": len(current) - len(written), "restart": restart}
+
+    def destroy(self):
+        shutil.rmtree(self.path, ignore_errors=True)